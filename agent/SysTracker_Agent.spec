@@ -31,6 +31,8 @@ a = Analysis(
         'websocket._url',
         'websocket._utils',
         'psutil',
+        'msgpack',
+        'orjson',
         'requests',
         'urllib3',
         'urllib3.util',
@@ -1,29 +1,135 @@
+import time
+_PROCESS_START = time.perf_counter()  # Reference point for STARTUP_TIMINGS
 import platform
 import socket
-import time
-import psutil
-import requests
 import json
 import logging
 import logging.handlers
 import datetime
-import socketio
+import importlib.util
 import threading
 import subprocess
 import sys
 import os
 import hashlib
+import gc
+import ctypes
+import queue
+import atexit
+import gzip
+import zlib
+import heapq
+import random
+import collections
+import concurrent.futures
+from array import array
+
+# psutil is needed by the first collection anyway. requests, socketio and pywin32
+# are imported inside the functions that use them, so they load on first use
+# (off the import path; the import lock makes that safe from any thread).
+import psutil
+
+STARTUP_TIMINGS = {"imports_ms": round((time.perf_counter() - _PROCESS_START) * 1000, 1)}
+STARTUP_BUDGET_MS = 3000  # First telemetry upload should complete within this
+
+# Socket.IO client, created on first use by get_sio(). Handlers are collected by
+# @socket_event and registered with sio.on() when the client is built.
+sio = None
+SOCKET_EVENT_HANDLERS = {}
 
-# Initialize Socket.IO Client
-sio = socketio.Client()
+def socket_event(handler):
+    SOCKET_EVENT_HANDLERS[handler.__name__] = handler
+    return handler
+
+def get_sio():
+    global sio
+    if sio is None:
+        import socketio  # Deferred: only the socket manager thread builds the client
+        client = socketio.Client(reconnection=False)  # SocketConnectionManager owns reconnects
+        for name, handler in SOCKET_EVENT_HANDLERS.items():
+            client.on(name, handler)
+        sio = client
+    return sio
 
 # Version - Define early so it's available for logging
 VERSION = "3.3.1"
 
-# Configure Logging to file and console with multiple fallback locations
+# --- Logging ---
+# Records go through a bounded in-memory queue; a background QueueListener does the
+# formatting and the (possibly slow) console/file I/O, so the collection loop never
+# blocks on the log volume. When the queue is full, records are dropped and counted.
+LOG_FORMAT = '%(asctime)s | %(levelname)-8s | %(funcName)-20s | %(message)s'
+LOG_QUEUE_SIZE = 10000
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting is deferred to the listener thread. The record is queued as-is
+        # (msg + args), so a %-style DEBUG call costs one level check when DEBUG is off.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_log_handler = None
+_log_listener = None
+
+def _start_log_listener(handlers):
+    """Route the root logger through the queue and start the listener thread."""
+    global _log_handler, _log_listener
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    _log_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    _log_listener = logging.handlers.QueueListener(_log_handler.queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(stop_log_listener)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_log_handler)
+    set_log_level(os.environ.get("SYSTRACKER_LOG_LEVEL", "INFO"))
+
+def stop_log_listener():
+    """Flush queued records to the handlers (call before os._exit)."""
+    global _log_listener
+    if _log_listener:
+        listener, _log_listener = _log_listener, None
+        listener.stop()
+
+def attach_log_handler(handler):
+    """Add a handler on the listener side (it runs off the hot path like the file handler)."""
+    if _log_listener:
+        _log_listener.handlers = _log_listener.handlers + (handler,)
+    else:
+        logging.getLogger().addHandler(handler)
+
+def set_log_level(level_name):
+    """Set the root level by name (DEBUG, INFO, ...); unknown names are ignored."""
+    level = logging.getLevelName(str(level_name).upper()) if level_name else None
+    if isinstance(level, int):
+        logging.getLogger().setLevel(level)
+
+def dropped_log_records():
+    return _log_handler.dropped if _log_handler else 0
+
 def setup_logging():
-    """Setup logging with fallback locations for maximum compatibility."""
-    
+    """
+    Find a writable log directory (fallback locations for maximum compatibility)
+    and add the rotating file handler. Called at startup rather than import, so
+    the directory probes stay off the import path; until then records go to the
+    console only.
+    """
+    global LOG_DIR
     # Try multiple log directory locations in order of preference
     log_locations = [
         # 1. ProgramData (best for Windows services)
@@ -54,22 +160,13 @@ def setup_logging():
     
     if not log_dir:
         print("ERROR: Could not create log directory in any location!")
-        # Use console-only logging as absolute fallback
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s | %(levelname)-8s | %(funcName)-20s | %(message)s',
-            handlers=[logging.StreamHandler()]
-        )
+        # Console-only logging as absolute fallback
         logging.warning("Running with console-only logging due to file system permissions")
         return None
     
     log_file = os.path.join(log_dir, f'agent_{datetime.datetime.now().strftime("%Y%m%d")}.log')
     print(f"✓ Log file: {log_file}")
     
-    # Create handlers
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    
     try:
         file_handler = logging.handlers.RotatingFileHandler(
             log_file, 
@@ -78,56 +175,66 @@ def setup_logging():
             encoding='utf-8'
         )
         file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
         
-        # Create formatter
-        formatter = logging.Formatter('%(asctime)s | %(levelname)-8s | %(funcName)-20s | %(message)s')
-        console_handler.setFormatter(formatter)
-        file_handler.setFormatter(formatter)
-        
-        # Configure root logger
-        logging.basicConfig(
-            level=logging.DEBUG,
-            handlers=[console_handler, file_handler]
-        )
+        # Queue -> listener -> console + file
+        attach_log_handler(file_handler)
+        LOG_DIR = log_dir
         
         logging.info("="*80)
         logging.info("SysTracker Agent Starting...")
-        logging.info(f"Version: {VERSION}")
-        logging.info(f"Python: {sys.version}")
-        logging.info(f"Platform: {platform.platform()}")
-        logging.info(f"Hostname: {socket.gethostname()}")
-        logging.info(f"Log Directory: {log_dir}")
-        logging.info(f"Log File: {log_file}")
+        logging.info("Version: %s", VERSION)
+        logging.info("Python: %s", sys.version)
+        logging.info("Platform: %s", platform.platform())
+        logging.info("Hostname: %s", socket.gethostname())
+        logging.info("Log Directory: %s", log_dir)
+        logging.info("Log File: %s", log_file)
         logging.info("="*80)
+        logging.info("Configuration loaded:")
+        logging.info("  API_URL: %s", DEFAULT_API_URL)
+        logging.info("  MACHINE_ID: %s", MACHINE_ID)
+        logging.info("  VERSION: %s", VERSION)
+        logging.info("  TELEMETRY_INTERVAL: %ss", TELEMETRY_INTERVAL)
+        logging.info("  EVENT_POLL_INTERVAL: %ss", EVENT_POLL_INTERVAL)
         
         return log_dir
         
     except Exception as e:
         print(f"ERROR: Could not create log file handler: {e}")
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s | %(levelname)-8s | %(funcName)-20s | %(message)s',
-            handlers=[logging.StreamHandler()]
-        )
-        logging.error(f"Failed to setup file logging: {e}")
+        logging.error("Failed to setup file logging: %s", e)
         return None
 
-# Initialize logging
-LOG_DIR = setup_logging()
+# Console logging from import on; setup_logging() adds the file at startup
+_console_handler = logging.StreamHandler()
+_console_handler.setLevel(logging.INFO)
+_start_log_listener([_console_handler])
+LOG_DIR = None
 
-# Try initializing Windows Event Log modules
+# Windows Event Log modules (pywin32), imported inside the events collector
+# (function-local, so they load on its first run rather than at startup)
 try:
-    import win32evtlog
-    import win32con
-    import win32api
-    WIN32_AVAILABLE = True
-except ImportError:
+    WIN32_AVAILABLE = all(importlib.util.find_spec(m) is not None for m in ("win32evtlog", "win32con", "win32api"))
+except (ImportError, ValueError):
     WIN32_AVAILABLE = False
 
+# Optional binary payload encoding (see encode_payload)
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Optional fast JSON backend (falls back to the stdlib encoder)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Configuration
 DEFAULT_API_URL = "https://monitor.rico.bd/api"
 DEFAULT_API_KEY = "YOUR_STATIC_API_KEY_HERE"
-TELEMETRY_INTERVAL = 3  # seconds — kept low for near-real-time updates
+TELEMETRY_INTERVAL = 10  # seconds between uploads; each carries min/max/mean/last of the 1s samples
 EVENT_POLL_INTERVAL = 300  # seconds (5 minutes)
 UPDATE_CHECK_INTERVAL = 3600  # seconds (60 minutes)
 MACHINE_ID = socket.gethostname()
@@ -138,27 +245,26 @@ EXE_NAME = "SysTracker_Agent.exe"
 MAX_RETRIES = 3
 retry_delay = 5
 
-logging.info("Configuration loaded:")
-logging.info(f"  API_URL: {DEFAULT_API_URL}")
-logging.info(f"  MACHINE_ID: {MACHINE_ID}")
-logging.info(f"  VERSION: {VERSION}")
-logging.info(f"  TELEMETRY_INTERVAL: {TELEMETRY_INTERVAL}s")
-logging.info(f"  EVENT_POLL_INTERVAL: {EVENT_POLL_INTERVAL}s")
-
-# Global State for Delta Calculation
-last_net_io = None
-last_net_time = None
 last_update_check = 0  # Track last update check time
+_update_check_due = 0.0  # Wall-clock time of a pushed update check (0 = none scheduled)
+_update_etag = None      # ETag/body of the last check-update answer (If-None-Match)
+_update_cached = None
 
 # CPU Primer: psutil.cpu_percent(interval=None) returns 0.0 on first call per process.
-# We prime it once at startup (non-blocking). All subsequent calls use interval=None.
-_cpu_primed = False
+# We prime it once at startup (non-blocking). All subsequent calls use interval=None;
+# a read that comes first waits for the primer instead of taking its own baseline.
+_cpu_primed = threading.Event()
+CPU_PRIME_WAIT = 1.0  # seconds a first read waits for _prime_cpu()
 
 def _prime_cpu():
     """Call cpu_percent with a short interval once at startup, then signal ready."""
-    global _cpu_primed
-    psutil.cpu_percent(interval=0.5)  # One-time 0.5s warm-up in background thread
-    _cpu_primed = True
+    collector = get_proc_collector()
+    if collector:
+        collector.collect()  # Baseline for the /proc/stat tick deltas
+        time.sleep(0.5)
+    else:
+        psutil.cpu_percent(interval=0.5)  # One-time 0.5s warm-up in background thread
+    _cpu_primed.set()
 
 # Global Config
 config = {
@@ -273,6 +379,7 @@ def run_setup_wizard():
         key_entry.pack(pady=2)
 
         def on_submit():
+            import requests
             url = url_entry.get().strip()
             key = key_entry.get().strip()
             
@@ -334,6 +441,7 @@ def is_admin():
         return False
 
 def install_agent(setup_url=None, setup_key=None):
+    import requests
     if not is_admin():
         # Re-run with admin privileges
         ctypes.windll.shell32.ShellExecuteW(None, "runas", sys.executable, " ".join(sys.argv[1:]), None, 1)
@@ -443,185 +551,2247 @@ def uninstall_agent():
     # We cannot delete the EXE if we are running from it, but we removed persistence.
     ctypes.windll.user32.MessageBoxW(0, "SysTracker Agent stopped and persistence removed.\nYou can now delete the files from C:\\Program Files\\SysTrackerAgent", "Uninstall Complete", 0x40)
 
-def send_payload(endpoint, data):
-    headers = {
-        "Content-Type": "application/json",
-        "X-API-Key": config["api_key"]
+# --- Payload Encoding ---
+# Schema 1 is the original row-per-object JSON. Schema 2 is MessagePack with the
+# repeated-key tables (processes, disks, interfaces) sent as {"cols": [...], "rows": [[...]]}.
+# MessagePack is opt-in (payload_encoding: "msgpack") and used only after a telemetry
+# response lists it in "encodings"; any 4xx to a MessagePack body puts the agent
+# back on JSON for the rest of the process lifetime. With orjson it costs ~3x the
+# encode CPU for bodies ~25% smaller (see --benchmark), so JSON stays the default.
+PAYLOAD_SCHEMA_JSON = 1
+PAYLOAD_SCHEMA_BINARY = 2
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+COLUMNAR_TABLES = ("processes", "disk_details", "network_interfaces")
+
+_binary_rejected = False  # Set when the server answers 4xx to a MessagePack body
+_binary_advertised = False  # Set when a telemetry response lists "msgpack" in "encodings"
+
+# Bodies at least this large are gzip-compressed (Content-Encoding: gzip)
+COMPRESS_MIN_BYTES = 4096
+
+def use_binary_encoding():
+    """True when MessagePack is installed, enabled by config, advertised and not rejected by the server."""
+    mode = config.get("payload_encoding", "json")
+    return MSGPACK_AVAILABLE and _binary_advertised and not _binary_rejected and mode in ("auto", "msgpack")
+
+def note_server_encodings(response):
+    """Read {"encodings": [...]} from a telemetry response."""
+    global _binary_advertised
+    try:
+        encodings = response.json().get("encodings")
+    except (ValueError, AttributeError):
+        return
+    if not isinstance(encodings, list):
+        return  # Not a telemetry response, or a server that predates negotiation
+    advertised = "msgpack" in encodings
+    if advertised != _binary_advertised:
+        _binary_advertised = advertised
+        logging.info("Server %s MessagePack payloads", "accepts" if advertised else "no longer accepts")
+
+def _dumps_json_stdlib(obj):
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+if ORJSON_AVAILABLE:
+    dumps_json = orjson.dumps
+    JSON_BACKEND = "orjson"
+else:
+    dumps_json = _dumps_json_stdlib
+    JSON_BACKEND = "json"
+
+class StaticPart:
+    """
+    A payload value that rarely changes (e.g. the machine stub).
+    Its encoded bytes are cached per format and spliced into every payload.
+    """
+    def __init__(self, value):
+        self.value = value
+        self._encoded = {}
+
+    def encoded(self, binary):
+        cached = self._encoded.get(binary)
+        if cached is None:
+            cached = msgpack.packb(self.value, use_bin_type=True) if binary else dumps_json(self.value)
+            self._encoded[binary] = cached
+        return cached
+
+def _to_columnar(rows):
+    """List of dicts -> {"cols": [...], "rows": [[...]]}, keeping first-seen key order."""
+    cols = []
+    seen = set()
+    for row in rows:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                cols.append(key)
+    return {"cols": cols, "rows": [[row.get(c) for c in cols] for row in rows]}
+
+def _from_columnar(table):
+    cols = table["cols"]
+    return [dict(zip(cols, row)) for row in table["rows"]]
+
+def encode_payload(data, binary=False):
+    """
+    Encode an outbound payload in a single pass. Returns (body_bytes, content_type).
+    Top-level StaticPart values are spliced in from their cached encoding.
+    The input dict is not modified.
+    """
+    body = dict(data, schema_version=PAYLOAD_SCHEMA_BINARY if binary else PAYLOAD_SCHEMA_JSON)
+
+    if not binary:
+        parts = []
+        for key, value in body.items():
+            encoded = value.encoded(False) if isinstance(value, StaticPart) else dumps_json(value)
+            parts.append(dumps_json(key) + b":" + encoded)
+        return b"{" + b",".join(parts) + b"}", CONTENT_TYPE_JSON
+
+    metrics = body.get("metrics")
+    if isinstance(metrics, dict):
+        metrics = dict(metrics)
+        for key in COLUMNAR_TABLES:
+            rows = metrics.get(key)
+            if isinstance(rows, list) and rows and isinstance(rows[0], dict):
+                metrics[key] = _to_columnar(rows)
+        body["metrics"] = metrics
+
+    packer = msgpack.Packer(use_bin_type=True)
+    out = bytearray(packer.pack_map_header(len(body)))
+    for key, value in body.items():
+        out += packer.pack(key)
+        out += value.encoded(True) if isinstance(value, StaticPart) else packer.pack(value)
+    return bytes(out), CONTENT_TYPE_MSGPACK
+
+class OutboundMessage:
+    """
+    A payload serialized exactly once. The same bytes are used for size
+    accounting, compression and every retry.
+    """
+    __slots__ = ("endpoint", "data", "body", "content_type", "content_encoding", "raw_size")
+
+    def __init__(self, endpoint, data, binary=False):
+        self.endpoint = endpoint
+        self.data = data  # Kept only to re-encode as JSON after a 4xx
+        self.encode(binary)
+
+    def encode(self, binary):
+        self.body, self.content_type = encode_payload(self.data, binary)
+        self.raw_size = len(self.body)
+        self.content_encoding = None
+        if self.raw_size >= COMPRESS_MIN_BYTES:
+            self.body = gzip.compress(self.body, compresslevel=6)
+            self.content_encoding = "gzip"
+
+    def headers(self):
+        headers = {
+            "Content-Type": self.content_type,
+            "X-API-Key": config["api_key"]
+        }
+        if self.content_encoding:
+            headers["Content-Encoding"] = self.content_encoding
+        return headers
+
+def decode_payload(body, content_type=CONTENT_TYPE_JSON, content_encoding=None):
+    """Inverse of OutboundMessage/encode_payload: returns the payload with tables expanded back to dicts."""
+    if content_encoding == "gzip":
+        body = gzip.decompress(body)
+    if content_type.split(";")[0].strip() == CONTENT_TYPE_MSGPACK:
+        data = msgpack.unpackb(body, raw=False)
+    else:
+        data = orjson.loads(body) if ORJSON_AVAILABLE else json.loads(body)
+
+    if data.get("schema_version", PAYLOAD_SCHEMA_JSON) >= PAYLOAD_SCHEMA_BINARY:
+        metrics = data.get("metrics")
+        if isinstance(metrics, dict):
+            for key in COLUMNAR_TABLES:
+                table = metrics.get(key)
+                if isinstance(table, dict) and "cols" in table:
+                    metrics[key] = _from_columnar(table)
+    return data
+
+def build_sample_payload():
+    """A payload shaped like a real telemetry upload (with hardware_info), for benchmarks."""
+    return {
+        "machine": {
+            "id": MACHINE_ID,
+            "hostname": socket.gethostname(),
+            "os_info": f"{platform.system()} {platform.release()}",
+            "version": VERSION,
+            "hardware_info": get_detailed_hardware_info(),
+        },
+        "metrics": get_system_metrics(),
     }
+
+def run_encoding_benchmark(cycles=200):
+    """
+    Compare what each encoding costs on the wire (encode + gzip, as OutboundMessage
+    sends it) against the stdlib json encoder, the path used when orjson is absent.
+    """
+    payload = build_sample_payload()
+    stub = dict(payload, machine=StaticPart({k: v for k, v in payload["machine"].items() if k != "hardware_info"}))
+
+    encoders = [("json", False, _dumps_json_stdlib)]
+    if ORJSON_AVAILABLE:
+        encoders.append(("orjson", False, orjson.dumps))
+    if MSGPACK_AVAILABLE:
+        encoders.append(("msgpack", True, dumps_json))
+    print(f"Encoding benchmark ({cycles} cycles, encode + gzip >= {COMPRESS_MIN_BYTES} B; baseline: stdlib json)")
+    if not MSGPACK_AVAILABLE:
+        print("  msgpack not installed; only JSON is available")
+
+    original_dumps = dumps_json
+    try:
+        for label, sample in (("telemetry", stub), ("telemetry+hardware", payload)):
+            baseline = None
+            for name, binary, dumps in encoders:
+                globals()["dumps_json"] = dumps
+                for part in sample.values():
+                    if isinstance(part, StaticPart):
+                        part._encoded.clear()
+                message = OutboundMessage("benchmark", sample, binary)
+                start = time.perf_counter()
+                for _ in range(cycles):
+                    OutboundMessage("benchmark", sample, binary)
+                encode_us = (time.perf_counter() - start) / cycles * 1e6
+                start = time.perf_counter()
+                for _ in range(cycles):
+                    decode_payload(message.body, message.content_type, message.content_encoding)
+                decode_us = (time.perf_counter() - start) / cycles * 1e6
+                if baseline is None:
+                    baseline = (len(message.body), encode_us)
+                print(f"  {label:<19} {name:<8} {len(message.body):7d} bytes ({len(message.body) / baseline[0] * 100:3.0f}%)  "
+                      f"encode {encode_us:8.1f} us ({encode_us / baseline[1] * 100:3.0f}%)  decode {decode_us:8.1f} us")
+    finally:
+        globals()["dumps_json"] = original_dumps
+
+# --- Fleet-aware send timing ---
+# Agents that boot together must not stay phase-locked: the first wait gets a random
+# phase offset, every wait gets +/- jitter, retries use full-jitter backoff, and the
+# server can slow the fleet down (429/503 + Retry-After, or a pacing hint in the
+# telemetry response).
+SEND_JITTER_FRACTION = 0.1  # +/- 10% on every upload wait
+SEND_BACKOFF_BASE = 5       # seconds; full jitter: uniform(0, min(cap, base * 2**attempt))
+SEND_BACKOFF_CAP = 60
+RETRY_AFTER_MAX = 900       # Never pause uploads longer than this on a server's word
+
+def parse_retry_after(value):
+    """Retry-After header (delta-seconds or HTTP-date) -> seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        from email.utils import parsedate_to_datetime
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.datetime.now(when.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class SendPacing:
+    """Shared send-timing state: server pause, server pacing hint and jitter helpers."""
+    def __init__(self):
+        self.paused_until = 0.0         # monotonic; uploads are skipped until then
+        self.server_min_interval = 0.0  # from the server's pacing hint
+        self._phase_applied = False
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(SEND_BACKOFF_CAP, SEND_BACKOFF_BASE * (2 ** attempt)))
+
+    def pause(self, seconds, reason):
+        seconds = min(max(seconds, 0.0), RETRY_AFTER_MAX)
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logging.warning("Server asked agents to back off (%s); pausing uploads for %.0fs", reason, seconds)
+
+    def paused(self):
+        return time.monotonic() < self.paused_until
+
+    def apply_hint(self, response):
+        """Read {"pacing": {"min_upload_interval": s}} from a telemetry response."""
+        try:
+            pacing = response.json().get("pacing") or {}
+        except ValueError:
+            return
+        interval = float(pacing.get("min_upload_interval") or 0)
+        if interval != self.server_min_interval:
+            logging.info("Server pacing: minimum upload interval %.0fs", interval)
+            self.server_min_interval = interval
+
+    def next_wait(self, interval):
+        """Jittered wait before the next upload; the first one also adds a random phase offset."""
+        wait = interval * random.uniform(1 - SEND_JITTER_FRACTION, 1 + SEND_JITTER_FRACTION)
+        if not self._phase_applied:
+            self._phase_applied = True
+            wait += random.uniform(0, interval)
+        if self.paused():
+            wait = max(wait, self.paused_until - time.monotonic())
+        return wait
+
+send_pacing = SendPacing()
+
+# --- Server health and Socket.IO connection manager ---
+SOCKET_BACKOFF_BASE = 2   # seconds; full jitter: uniform(0, min(cap, base * 2**failures))
+SOCKET_BACKOFF_CAP = 300
+SOCKET_CONNECT_TIMEOUT = 5
+HTTP_DOWN_AFTER_FAILURES = 3  # Consecutive failed uploads before the server counts as down
+
+class ServerHealth:
+    """
+    Reachability shared by the HTTP sender and the Socket.IO manager. A successful
+    upload while the socket is down wakes the manager for an immediate reconnect;
+    when both channels are failing the sender stops spending the loop on retries.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.http_failures = 0
+        self.http_ok_at = None      # wall clock of the last successful upload
+        self.socket_connected = False
+
+    def http_result(self, ok):
+        with self._lock:
+            was_down = self.http_failures >= HTTP_DOWN_AFTER_FAILURES
+            self.http_failures = 0 if ok else self.http_failures + 1
+            if ok:
+                self.http_ok_at = time.time()
+        if ok and was_down and not self.socket_connected:
+            socket_manager.wake()  # Server just came back: retry the socket now, not at the end of its backoff
+
+    def socket_state(self, connected):
+        with self._lock:
+            self.socket_connected = connected
+            if connected:
+                self.http_failures = 0  # The server answered a handshake, so it is up
+
+    def server_down(self):
+        with self._lock:
+            return self.http_failures >= HTTP_DOWN_AFTER_FAILURES and not self.socket_connected
+
+    def status(self):
+        with self._lock:
+            return {
+                "socket_connected": self.socket_connected,
+                "http_failures": self.http_failures,
+                "socket_reconnects": socket_manager.reconnects,
+            }
+
+server_health = ServerHealth()
+
+class SocketConnectionManager:
+    """
+    Owns the Socket.IO connection on a background thread: connects, waits for a
+    disconnect, and reconnects with full-jitter exponential backoff. The telemetry
+    loop never touches the handshake. (The client is built with reconnection=False
+    so python-socketio's own reconnect loop does not race this one.)
+    """
+    def __init__(self):
+        self._wake = threading.Event()
+        self._thread = None
+        self.failures = 0
+        self.reconnects = 0
+        self._ever_connected = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="SocketManager")
+            self._thread.start()
+
+    def wake(self):
+        """Skip the current backoff/wait (disconnect seen, or HTTP says the server is back)."""
+        self._wake.set()
+
+    def _connect_once(self, client):
+        server_url = config.get("api_url", "").replace("/api", "")
+        if not server_url:
+            logging.error("✗ Cannot connect to Socket.IO: Server URL not configured")
+            return False
+        try:
+            # Construct query params (python-socketio handles query in url)
+            query_url = f"{server_url}?role=agent&id={MACHINE_ID}&v={VERSION}"
+            logging.info("Attempting to connect to Socket.IO at %s (Machine ID: %s)", server_url, MACHINE_ID)
+            client.connect(query_url, namespaces=['/'], auth={"api_key": config.get("api_key")},
+                           wait_timeout=SOCKET_CONNECT_TIMEOUT)
+            logging.info("✓ Connected to Socket.IO at %s", server_url)
+            STARTUP_TIMINGS.setdefault("socket_connect_ms", round((time.perf_counter() - _PROCESS_START) * 1000, 1))
+            return True
+        except Exception as e:
+            logging.error("✗ Socket.IO connection failed: %s", e)
+            return False
+
+    def _run(self):
+        client = get_sio()
+        while True:
+            if client.connected:
+                self.failures = 0
+                self._wake.wait(60)  # The disconnect handler wakes us; the timeout is a safety net
+                self._wake.clear()
+                continue
+
+            if self._connect_once(client):
+                if self._ever_connected:
+                    self.reconnects += 1
+                self._ever_connected = True
+                self.failures = 0
+                continue
+
+            delay = random.uniform(0, min(SOCKET_BACKOFF_CAP, SOCKET_BACKOFF_BASE * (2 ** self.failures)))
+            self.failures += 1
+            logging.info("  Socket.IO retry in %.1fs (attempt %d)", delay, self.failures)
+            self._wake.wait(delay)
+            self._wake.clear()
+
+socket_manager = SocketConnectionManager()
+
+def send_payload(endpoint, data):
+    global _binary_rejected
+    import requests
+    message = OutboundMessage(endpoint, data, use_binary_encoding())
     url = f"{config['api_url']}/{endpoint}"
-    
-    logging.debug(f"Preparing to send payload to {endpoint}")
-    logging.debug(f"  URL: {url}")
-    logging.debug(f"  Data size: {len(json.dumps(data))} bytes")
-    
-    max_retries = 3
-    retry_delay = 5 # Start with 5s
-    
+
+    logging.debug("Preparing to send payload to %s", endpoint)
+    logging.debug("  URL: %s", url)
+    logging.debug("  Data size: %d bytes (%s), %d bytes on the wire", message.raw_size, message.content_type, len(message.body))
+
+    # While both channels say the server is down, one attempt per cycle is enough
+    max_retries = 1 if server_health.server_down() else 3
+
     for attempt in range(max_retries):
         try:
-            logging.info(f"Sending request to {endpoint} (Attempt {attempt+1}/{max_retries})...")
-            response = requests.post(url, json=data, headers=headers, timeout=10)
+            logging.debug("Sending request to %s (Attempt %d/%d)...", endpoint, attempt + 1, max_retries)
+            response = requests.post(url, data=message.body, headers=message.headers(), timeout=10)
+            if (message.content_type == CONTENT_TYPE_MSGPACK and 400 <= response.status_code < 500
+                    and response.status_code not in (401, 403, 429)):
+                logging.warning("Server answered HTTP %d to a MessagePack payload; switching to JSON", response.status_code)
+                _binary_rejected = True
+                message.encode(False)
+                response = requests.post(url, data=message.body, headers=message.headers(), timeout=10)
+            if response.status_code in (429, 503):
+                # Overloaded server: do not retry now, pause uploads for Retry-After (or a jittered backoff)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                send_pacing.pause(retry_after if retry_after is not None else send_pacing.backoff(attempt + 2),
+                                  f"HTTP {response.status_code}")
+                return False
             response.raise_for_status()
-            logging.info(f"✓ Successfully sent data to {endpoint} (Status: {response.status_code})")
+            send_pacing.apply_hint(response)
+            note_server_encodings(response)
+            server_health.http_result(True)
+            logging.debug("✓ Successfully sent data to %s (Status: %s)", endpoint, response.status_code)
             return True
         except requests.exceptions.HTTPError as e:
-            logging.error(f"✗ HTTP Error posting to {endpoint}: {e}")
-            logging.error(f"  Status Code: {e.response.status_code}")
-            logging.error(f"  Response: {e.response.text[:200] if e.response.text else 'No response body'}")
+            logging.error("✗ HTTP Error posting to %s: %s", endpoint, e)
+            logging.error("  Status Code: %s", e.response.status_code)
+            logging.error("  Response: %s", e.response.text[:200] if e.response.text else 'No response body')
             if e.response.status_code in [401, 403]:
                 logging.error("  Authentication failed. Check API Key.")
                 logging.error(f"  Using API Key: ***{config.get('api_key', '')[-4:]}")
                 return False # Stop retrying on auth error
         except requests.exceptions.ConnectionError as e:
-            logging.error(f"✗ Connection error posting to {endpoint} (Attempt {attempt+1}/{max_retries})")
-            logging.error(f"  Error: {e}")
-            logging.error(f"  Check if server {config['api_url']} is reachable")
+            logging.error("✗ Connection error posting to %s (Attempt %d/%d)", endpoint, attempt + 1, max_retries)
+            logging.error("  Error: %s", e)
+            logging.error("  Check if server %s is reachable", config['api_url'])
         except requests.exceptions.Timeout as e:
-            logging.error(f"✗ Timeout posting to {endpoint} (Attempt {attempt+1}/{max_retries})")
-            logging.error(f"  Error: {e}")
+            logging.error("✗ Timeout posting to %s (Attempt %d/%d)", endpoint, attempt + 1, max_retries)
+            logging.error("  Error: %s", e)
         except requests.exceptions.RequestException as e:
-            logging.error(f"✗ Request error posting to {endpoint} (Attempt {attempt+1}/{max_retries})")
-            logging.error(f"  Error: {e}")
+            logging.error("✗ Request error posting to %s (Attempt %d/%d)", endpoint, attempt + 1, max_retries)
+            logging.error("  Error: %s", e)
         
-        # Wait before retrying (unless it's the last attempt)
+        # Wait before retrying (unless it's the last attempt); full jitter so agents do not retry in lockstep
         if attempt < max_retries - 1:
-            logging.info(f"  Waiting {retry_delay}s before retry...")
+            retry_delay = send_pacing.backoff(attempt)
+            logging.info("  Waiting %.1fs before retry...", retry_delay)
             time.sleep(retry_delay)
-            retry_delay *= 2 # Exponential backoff: 5, 10, 20...
             
-    logging.error(f"✗ Failed to send payload to {endpoint} after {max_retries} attempts.")
+    server_health.http_result(False)
+    logging.error("✗ Failed to send payload to %s after %d attempts.", endpoint, max_retries)
     return False
 
+# --- Log shipping to /api/logs ---
+LOG_SHIPPING_DEFAULTS = {
+    "enabled": True,
+    "info_sample_rate": 0.0,     # Fraction of INFO records shipped (WARNING+ always)
+    "flush_interval": 60,        # Seconds between batch uploads
+    "max_batch_bytes": 64 * 1024,  # Flush early once the buffered messages reach this size
+    "rate_per_minute": 60,       # Token bucket refill; bursts up to 2x
+    "buffer_limit": 1000,        # Oldest records are dropped beyond this
+}
+# Loggers whose records are never shipped: the shipper's own HTTP stack would feed back into itself
+LOG_SHIPPING_EXCLUDED = ("urllib3", "requests", "socketio", "engineio", "websocket")
+
+class LogShipper(logging.Handler):
+    """
+    Listener-side handler that batches WARNING+ (and sampled INFO) records and
+    posts them gzip-compressed to /api/logs from its own thread. A token bucket
+    limits how many records an error loop can push; suppressed records are
+    counted and reported in the next batch.
+    """
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.settings = dict(LOG_SHIPPING_DEFAULTS)
+        self._buffer = collections.deque()
+        self._buffer_bytes = 0
+        self._lock = threading.Lock()
+        self._flush_now = threading.Event()
+        self._tokens = 0.0
+        self._token_time = time.monotonic()
+        self.suppressed = 0
+        self.dropped = 0
+        self.sent = 0
+        self._thread = None
+
+    def configure(self, overrides=None):
+        self.settings = dict(LOG_SHIPPING_DEFAULTS)
+        if isinstance(overrides, dict):
+            self.settings.update({k: v for k, v in overrides.items() if k in LOG_SHIPPING_DEFAULTS})
+        self._tokens = 2.0 * self.settings["rate_per_minute"]
+
+    def start(self):
+        if self._thread or not self.settings["enabled"]:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="LogShipper")
+        self._thread.start()
+        attach_log_handler(self)
+
+    def _take_token(self):
+        rate = self.settings["rate_per_minute"] / 60.0
+        now = time.monotonic()
+        self._tokens = min(2.0 * self.settings["rate_per_minute"], self._tokens + (now - self._token_time) * rate)
+        self._token_time = now
+        if self._tokens < 1.0:
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def emit(self, record):
+        # Runs on the QueueListener thread, never on the collection loop
+        if record.name.startswith(LOG_SHIPPING_EXCLUDED) or record.threadName == "LogShipper":
+            return
+        if record.levelno < logging.WARNING:
+            rate = self.settings["info_sample_rate"]
+            if rate <= 0 or random.random() >= rate:
+                return
+        if not self._take_token():
+            self.suppressed += 1
+            return
+        try:
+            entry = {
+                "level": "warn" if record.levelno == logging.WARNING else record.levelname.lower(),
+                "message": f"{record.funcName}: {record.getMessage()}",
+                "stack_trace": logging.Formatter().formatException(record.exc_info) if record.exc_info else None,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(record.created)),
+            }
+        except Exception:
+            self.handleError(record)
+            return
+        with self._lock:
+            self._buffer.append(entry)
+            self._buffer_bytes += len(entry["message"])
+            while len(self._buffer) > self.settings["buffer_limit"]:
+                self._buffer_bytes -= len(self._buffer.popleft()["message"])
+                self.dropped += 1
+            if self._buffer_bytes >= self.settings["max_batch_bytes"]:
+                self._flush_now.set()
+
+    def trim_buffer(self, keep):
+        """Keep only the newest `keep` records (memory shedding); returns how many were dropped."""
+        with self._lock:
+            dropped = max(0, len(self._buffer) - keep)
+            for _ in range(dropped):
+                self._buffer_bytes -= len(self._buffer.popleft()["message"])
+            self.dropped += dropped
+            return dropped
+
+    def export_buffer(self):
+        with self._lock:
+            return list(self._buffer)
+
+    def import_buffer(self, records):
+        with self._lock:
+            for entry in records or []:
+                self._buffer.append(entry)
+                self._buffer_bytes += len(entry.get("message", ""))
+
+    def _take_batch(self):
+        with self._lock:
+            batch = list(self._buffer)
+            self._buffer.clear()
+            self._buffer_bytes = 0
+        if self.suppressed:
+            batch.append({
+                "level": "warn",
+                "message": f"LogShipper: {self.suppressed} record(s) suppressed by rate limit",
+                "stack_trace": None,
+                "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            })
+            self.suppressed = 0
+        return batch
+
+    def flush_batch(self):
+        """Post the buffered records. Failures are not logged (that would feed back in); the batch is requeued once."""
+        import requests
+        batch = self._take_batch()
+        if not batch:
+            return True
+        body = gzip.compress(dumps_json({"machine_id": MACHINE_ID, "records": batch}), compresslevel=6)
+        headers = {
+            "Content-Type": CONTENT_TYPE_JSON,
+            "Content-Encoding": "gzip",
+            "X-API-Key": config["api_key"]
+        }
+        try:
+            response = requests.post(f"{config['api_url']}/logs", data=body, headers=headers, timeout=10)
+            response.raise_for_status()
+            self.sent += len(batch)
+            return True
+        except Exception:
+            with self._lock:
+                for entry in reversed(batch):
+                    self._buffer.appendleft(entry)
+                    self._buffer_bytes += len(entry["message"])
+                while len(self._buffer) > self.settings["buffer_limit"]:
+                    self._buffer_bytes -= len(self._buffer.popleft()["message"])
+                    self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            self._flush_now.wait(self.settings["flush_interval"])
+            self._flush_now.clear()
+            self.flush_batch()
+
+log_shipper = LogShipper()
+
 # ... (Previous Code) ...
 
+IS_LINUX = sys.platform.startswith('linux')
+CPU_COUNT = os.cpu_count() or 1
+CLK_TCK = os.sysconf('SC_CLK_TCK') if IS_LINUX else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if IS_LINUX else 4096
 
+class LinuxProcCollector:
+    """
+    Reads /proc/stat, /proc/meminfo, /proc/net/dev and /proc/uptime in one pass.
+    The files stay open and are re-read with pread() into fixed buffers, so a
+    cycle costs four syscalls instead of psutil reopening and reparsing each file.
+    """
+
+    PROC_FILES = ('/proc/stat', '/proc/meminfo', '/proc/net/dev', '/proc/uptime')
+    BUFFER_SIZE = 16 * 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fds = []
+        self._buffers = []
+        try:
+            for path in self.PROC_FILES:
+                self._fds.append(os.open(path, os.O_RDONLY))
+                self._buffers.append(bytearray(self.BUFFER_SIZE))
+        except OSError:
+            self.close()
+            raise
+        self._last_cpu_total = None
+        self._last_cpu_busy = None
+
+    def close(self):
+        for fd in self._fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds = []
+
+    def _read(self, index):
+        """
+        pread() the whole file at offset 0, growing its buffer if it was filled.
+        Returns a view of the buffer (valid until the next read of this file);
+        parsers search it through view.obj bounded by len(view), copying only
+        the lines they use.
+        """
+        while True:
+            buf = self._buffers[index]
+            n = os.preadv(self._fds[index], [buf], 0)
+            if n < len(buf):
+                return memoryview(buf)[:n]
+            self._buffers[index] = bytearray(len(buf) * 2)
+
+    def _parse_cpu(self, data):
+        # "cpu  user nice system idle iowait irq softirq steal guest guest_nice"
+        buf = data.obj
+        fields = [int(x) for x in buf[:buf.index(b'\n', 0, len(data))].split()[1:]]
+        total = sum(fields[:8])  # guest/guest_nice are already counted in user/nice
+        busy = total - fields[3] - (fields[4] if len(fields) > 4 else 0)
+        percent = 0.0
+        if self._last_cpu_total is not None:
+            total_delta = total - self._last_cpu_total
+            busy_delta = busy - self._last_cpu_busy
+            if total_delta > 0:
+                percent = round(min(max(busy_delta / total_delta * 100, 0.0), 100.0), 1)
+        self._last_cpu_total = total
+        self._last_cpu_busy = busy
+        return percent
+
+    @staticmethod
+    def _meminfo_kb(data, key):
+        buf = data.obj
+        start = buf.find(key, 0, len(data))
+        if start < 0:
+            return None
+        end = buf.index(b'\n', start, len(data))
+        return int(buf[start + len(key):end].split()[0])
+
+    @staticmethod
+    def _netdev_totals(data):
+        """(sent, recv) summed over every interface but loopback."""
+        buf, size = data.obj, len(data)
+        sent = 0
+        recv = 0
+        pos = buf.index(b'\n', buf.index(b'\n', 0, size) + 1, size) + 1  # Skip the two header lines
+        while pos < size:
+            end = buf.find(b'\n', pos, size)
+            if end < 0:
+                end = size
+            name, sep, counters = buf[pos:end].partition(b':')
+            pos = end + 1
+            if not sep or name.strip() == b'lo':
+                continue  # Loopback traffic is not network throughput
+            fields = counters.split()
+            recv += int(fields[0])
+            sent += int(fields[8])
+        return sent, recv
+
+    def collect(self):
+        """Return a new sample dict; safe to call from several threads."""
+        with self._lock:
+            stat = self._read(0)
+            meminfo = self._read(1)
+            netdev = self._read(2)
+            uptime = self._read(3)
+
+            sample = {"cpu_percent": self._parse_cpu(stat)}
+
+            total_kb = self._meminfo_kb(meminfo, b'MemTotal:')
+            avail_kb = self._meminfo_kb(meminfo, b'MemAvailable:')
+            if avail_kb is None:  # Kernels older than 3.14
+                avail_kb = (self._meminfo_kb(meminfo, b'MemFree:') or 0) + \
+                           (self._meminfo_kb(meminfo, b'Buffers:') or 0) + \
+                           (self._meminfo_kb(meminfo, b'Cached:') or 0)
+            sample["ram_total"] = total_kb * 1024
+            sample["ram_percent"] = round((total_kb - avail_kb) / total_kb * 100, 1) if total_kb else 0.0
+
+            sample["net_bytes_sent"], sample["net_bytes_recv"] = self._netdev_totals(netdev)
+
+            buf = uptime.obj
+            sample["uptime_seconds"] = int(float(buf[:buf.index(b' ', 0, len(uptime))]))
+            return sample
+
+_proc_collector = None
+_proc_collector_failed = False
+_proc_collector_lock = threading.Lock()
+
+def get_proc_collector():
+    """Return the shared LinuxProcCollector, or None when not on Linux or /proc is unusable."""
+    global _proc_collector, _proc_collector_failed
+    if _proc_collector is None and IS_LINUX and not _proc_collector_failed:
+        with _proc_collector_lock:  # _prime_cpu() and the first cycle may race here
+            if _proc_collector is None and not _proc_collector_failed:
+                try:
+                    collector = LinuxProcCollector()
+                    collector.collect()
+                    _proc_collector = collector
+                except Exception as e:
+                    logging.warning("Fast /proc collector unavailable, using psutil: %s", e)
+                    _proc_collector_failed = True
+    return _proc_collector
+
+def run_collector_benchmark(cycles=200):
+    """Compare the per-cycle cost of the psutil calls against LinuxProcCollector."""
+    def per_cycle_us(fn):
+        fn()  # Warm-up
+        start = time.perf_counter()
+        for _ in range(cycles):
+            fn()
+        return (time.perf_counter() - start) / cycles * 1e6
+
+    def psutil_cycle():
+        psutil.cpu_percent(interval=None)
+        psutil.virtual_memory()
+        psutil.virtual_memory()
+        psutil.net_io_counters()
+        psutil.boot_time()
+
+    print(f"Collector benchmark ({cycles} cycles)")
+    psutil_us = per_cycle_us(psutil_cycle)
+    print(f"  psutil:            {psutil_us:9.1f} us/cycle")
+
+    collector = get_proc_collector()
+    if not collector:
+        print("  LinuxProcCollector: not available on this platform")
+        return
+    proc_us = per_cycle_us(collector.collect)
+    print(f"  LinuxProcCollector:{proc_us:9.1f} us/cycle ({psutil_us / proc_us:.1f}x faster)")
+
+TOP_PROCESS_COUNT = 15
+
+def get_top_processes_psutil(total_ram, limit):
+    """Top processes by CPU via psutil.process_iter (name, cpu and memory for every process)."""
+    processes = []
+    cpu_count = psutil.cpu_count()
+    for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info']):
+        try:
+            pinfo = proc.info
+            mem_bytes = pinfo['memory_info'].rss if pinfo['memory_info'] else 0
+            processes.append({
+                'name': pinfo['name'],
+                'pid': pinfo['pid'],
+                'cpu': round((pinfo['cpu_percent'] or 0) / cpu_count, 1),          # Normalized by core count
+                'mem': round((mem_bytes / total_ram * 100), 1) if total_ram else 0,
+                'mem_mb': round(mem_bytes / (1024 * 1024), 1),
+            })
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+
+    processes.sort(key=lambda p: p['cpu'], reverse=True)
+    return processes[:limit]
+
+# Two-phase Linux process scan state.
+# Keys are (pid, starttime) so a recycled PID is never mistaken for the old process.
+_proc_ticks = {}        # (pid, starttime) -> utime + stime at the previous scan
+_proc_scan_time = None  # monotonic timestamp of the previous scan
+_proc_names = {}        # (pid, starttime) -> resolved process name; replaced, never cleared, by shed_memory()
+
+def _scan_proc_stat():
+    """
+    Phase 1: read only /proc/[pid]/stat for every PID.
+    Returns (pid, starttime, cpu_ticks, rss_pages, comm) tuples.
+    """
+    entries = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                data = f.read()
+            # comm may contain spaces or parentheses, so split after the last ')'
+            lparen = data.index(b'(')
+            rparen = data.rindex(b')')
+            fields = data[rparen + 2:].split()
+            # fields[0] is stat field 3 (state), so stat field N is fields[N - 3]
+            ticks = int(fields[11]) + int(fields[12])   # utime (14) + stime (15)
+            starttime = int(fields[19])                 # starttime (22)
+            rss_pages = int(fields[21])                 # rss (24)
+            entries.append((int(entry), starttime, ticks, rss_pages, data[lparen + 1:rparen]))
+        except (OSError, ValueError, IndexError):
+            continue  # Process exited mid-scan or stat unreadable
+    return entries
+
+def _resolve_process_name(pid, starttime, comm):
+    """Phase 2: full name for a top-K candidate, cached for the lifetime of the process."""
+    key = (pid, starttime)
+    name = _proc_names.get(key)
+    if name is None:
+        try:
+            # psutil expands names that the kernel truncated to 15 chars via cmdline
+            name = psutil.Process(pid).name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            name = comm.decode('utf-8', errors='replace')
+        _proc_names[key] = name
+    return name
+
+def get_top_processes_linux(total_ram, limit):
+    """Top processes by CPU: cheap tick/RSS pass over all PIDs, names only for the top-K."""
+    global _proc_ticks, _proc_scan_time
+    now = time.monotonic()
+    elapsed = (now - _proc_scan_time) if _proc_scan_time else 0
+    entries = _scan_proc_stat()
+
+    ticks_by_key = {}
+    ranked = []
+    for pid, starttime, ticks, rss_pages, comm in entries:
+        key = (pid, starttime)
+        ticks_by_key[key] = ticks
+        prev = _proc_ticks.get(key)
+        # First sighting reports 0.0, matching psutil's first cpu_percent() call
+        delta = (ticks - prev) if prev is not None else 0
+        ranked.append((delta, pid, starttime, rss_pages, comm))
+
+    _proc_ticks = ticks_by_key
+    _proc_scan_time = now
+    # Forget names of processes that have exited (shed_memory() may swap the dict meanwhile)
+    names = _proc_names
+    for key in [k for k in names if k not in ticks_by_key]:
+        names.pop(key, None)
+
+    # Percent of one core, normalized by core count like the psutil path
+    scale = 100.0 / (CLK_TCK * elapsed * CPU_COUNT) if elapsed > 0 else 0.0
+    processes = []
+    for delta, pid, starttime, rss_pages, comm in heapq.nlargest(limit, ranked, key=lambda r: r[0]):
+        mem_bytes = rss_pages * PAGE_SIZE
+        processes.append({
+            'name': _resolve_process_name(pid, starttime, comm),
+            'pid': pid,
+            'cpu': round(delta * scale, 1),
+            'mem': round((mem_bytes / total_ram * 100), 1) if total_ram else 0,
+            'mem_mb': round(mem_bytes / (1024 * 1024), 1),
+        })
+    return processes
+
+def _read_core_counters():
+    """cpu %, ram %, total ram and uptime (fast /proc path on Linux)."""
+    _cpu_primed.wait(CPU_PRIME_WAIT)
+    collector = get_proc_collector()
+    if collector:
+        fast = collector.collect()
+        return fast["cpu_percent"], fast["ram_percent"], fast["ram_total"], fast["uptime_seconds"]
+
+    # Non-blocking CPU read (accurate after _prime_cpu() has run once)
+    cpu = psutil.cpu_percent(interval=None)
+    ram = psutil.virtual_memory()
+    return cpu, ram.percent, ram.total, int(time.time() - psutil.boot_time())
+
+# --- Per-NIC throughput ---
+# A dedicated sampler reads per-interface byte counters on a fixed monotonic cadence,
+# so rates no longer depend on how long the main loop's last cycle (or a retry stall)
+# took, or on wall-clock jumps. A counter that goes backwards is a 32-bit wrap only
+# when the wrapped delta is plausible for the link speed; anything else is a reset
+# (driver reload, interface re-created), which re-baselines that NIC and reports 0.
+NIC_SAMPLE_INTERVAL = 2   # seconds
+NIC_RATE_HALF_LIFE = 10   # seconds; EWMA half-life of the published rates
+NIC_DEFAULT_MAX_BPS = 125_000_000  # bytes/s assumed when the link speed is unknown (1 Gbit/s)
+COUNTER_WRAP_32 = 1 << 32
+COUNTER_WRAP_NEAR = COUNTER_WRAP_32 // 4  # Widest "near 2**32" band, whatever the link speed or stall
+
+def _is_loopback(nic):
+    nic = nic.lower()
+    return nic in ('lo', 'loopback') or nic.startswith('loop')
+
+def _read_nic_counters():
+    """{nic: (bytes_sent, bytes_recv)} for every non-loopback interface."""
+    if IS_LINUX:
+        try:
+            with open('/proc/net/dev', 'rb') as f:
+                lines = f.read().split(b'\n')[2:]
+            counters = {}
+            for line in lines:
+                name, sep, rest = line.partition(b':')
+                if not sep:
+                    continue
+                fields = rest.split()
+                counters[name.strip().decode(errors='replace')] = (int(fields[8]), int(fields[0]))
+            return {nic: c for nic, c in counters.items() if not _is_loopback(nic)}
+        except (OSError, ValueError, IndexError):
+            pass
+    return {nic: (io.bytes_sent, io.bytes_recv)
+            for nic, io in psutil.net_io_counters(pernic=True).items() if not _is_loopback(nic)}
+
+def _counter_delta(new, old, max_bytes):
+    """
+    Bytes between two counter readings, or None when the counter was reset. A backwards
+    step counts as a 32-bit wrap only if old was near 2**32 (within max_bytes, capped at
+    COUNTER_WRAP_NEAR so fast links and long stalls cannot widen it to the whole range)
+    and the wrapped delta fits in max_bytes (what the link could carry over the interval).
+    """
+    if new >= old:
+        return new - old
+    wrapped = new + COUNTER_WRAP_32 - old
+    near = COUNTER_WRAP_32 - min(max_bytes, COUNTER_WRAP_NEAR)
+    if near <= old < COUNTER_WRAP_32 and wrapped <= max_bytes:
+        return wrapped
+    return None
+
+def _link_max_bps(nic):
+    """Upper bound on bytes/s for nic from its reported link speed."""
+    try:
+        stats = psutil.net_if_stats().get(nic)
+    except OSError:
+        stats = None
+    if stats and stats.speed > 0:
+        return stats.speed * 125_000  # Mbit/s -> bytes/s
+    return NIC_DEFAULT_MAX_BPS
+
+class NicThroughputSampler:
+    """Background per-NIC rate sampler; get_system_metrics() only reads its published rates."""
+    def __init__(self, interval=NIC_SAMPLE_INTERVAL, half_life=NIC_RATE_HALF_LIFE):
+        self.interval = interval
+        self.half_life = half_life
+        self._last = {}
+        self._last_time = None
+        self._rates = {}  # nic -> (up_kbps, down_kbps)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.resets = 0
+
+    def start(self):
+        if self._thread:
+            return
+        self.sample()  # Baseline
+        self._thread = threading.Thread(target=self._run, daemon=True, name="nic-sampler")
+        self._thread.start()
+
+    def _run(self):
+        next_tick = time.monotonic() + self.interval
+        while True:
+            time.sleep(max(next_tick - time.monotonic(), 0))
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error("NIC sampler error: %s", e)
+            next_tick += self.interval
+            if next_tick < time.monotonic():
+                next_tick = time.monotonic() + self.interval  # Skip missed ticks after a stall
+
+    def sample(self, now=None, counters=None):
+        now = time.monotonic() if now is None else now
+        counters = _read_nic_counters() if counters is None else counters
+        elapsed = now - self._last_time if self._last_time is not None else 0
+        rates = {}
+        for nic, (sent, recv) in counters.items():
+            prev = self._last.get(nic)
+            old = self._rates.get(nic)
+            if prev is None or elapsed <= 0:
+                continue  # New interface: wait for a second reading
+            if sent < prev[0] or recv < prev[1]:
+                max_bytes = _link_max_bps(nic) * elapsed  # Only looked up on a backwards step
+            else:
+                max_bytes = 0
+            up = _counter_delta(sent, prev[0], max_bytes)
+            down = _counter_delta(recv, prev[1], max_bytes)
+            if up is None or down is None:
+                self.resets += 1
+                logging.info("Network counters reset on %s; re-baselining", nic)
+                rates[nic] = (0.0, 0.0)
+                continue
+            up_kbps = up / elapsed / 1024
+            down_kbps = down / elapsed / 1024
+            if old:
+                keep = 0.5 ** (elapsed / self.half_life)
+                up_kbps += (old[0] - up_kbps) * keep
+                down_kbps += (old[1] - down_kbps) * keep
+            rates[nic] = (up_kbps, down_kbps)
+        with self._lock:
+            self._rates = rates
+        self._last = counters
+        self._last_time = now
+
+    def rates(self):
+        with self._lock:
+            return dict(self._rates)
+
+nic_sampler = NicThroughputSampler()
+
+# --- Disk inventory ---
+# A dead SMB mount or a spun-down removable drive can block disk_usage() for
+# minutes. The partition list is cached and re-read only when the mount table
+# changes, every disk_usage() runs on its own daemon thread under a deadline, and a
+# mount that misses it is quarantined and retried on its own slower period. Until
+# then its last value is reported with stale/age_seconds.
+DISK_USAGE_DEADLINE = 2.0       # seconds the cycle waits for all disk_usage() calls together
+DISK_SLOW_REFRESH = 300         # seconds between attempts on a quarantined (slow) mount
+DISK_PARTITION_REFRESH = 300    # partition list refresh when mount changes cannot be detected
+DISK_MAX_ABANDONED = 3          # hung disk_usage() calls tolerated before slow mounts stop being retried
+
+def _daemon_call(fn, *args, name="daemon-call"):
+    """
+    Run fn(*args) on a fresh daemon thread and return a Future. A call stuck in a
+    blocking syscall (dead NFS/SMB stat, WMI) then holds no shared worker and does
+    not keep the interpreter from exiting.
+    """
+    future = concurrent.futures.Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True, name=name).start()
+    return future
+
+def _mount_signature():
+    """Cheap token that changes when mounts change, or None if the platform has none."""
+    if IS_LINUX:
+        try:
+            with open('/proc/self/mounts', 'rb') as f:
+                return hashlib.sha1(f.read()).digest()
+        except OSError:
+            return None
+    if sys.platform == 'win32':
+        try:
+            return ctypes.windll.kernel32.GetLogicalDrives()  # Bitmask of drive letters
+        except (AttributeError, OSError):
+            return None
+    return None
+
+class DiskInventory:
+    """Cached partition list plus deadline-guarded, per-mount disk_usage() results."""
+    def __init__(self):
+        self._partitions = []
+        self._signature = None
+        self._listed_at = None
+        self._listing = None      # Pending disk_partitions() call
+        self._usage = {}          # mount -> (usage, monotonic time it was read)
+        self._pending = {}        # mount -> disk_usage() future that has not returned yet (at most one)
+        self._quarantine = {}     # mount -> monotonic time of the next allowed attempt
+        self.timeouts = 0
+
+    def partitions(self, now):
+        signature = _mount_signature()
+        if self._listed_at is not None and self._listing is None:
+            if signature is not None and signature == self._signature:
+                return self._partitions
+            if signature is None and now - self._listed_at < DISK_PARTITION_REFRESH:
+                return self._partitions
+        # disk_partitions() itself can block on a dead network drive (Windows); a listing
+        # still running from an earlier cycle is only polled, not waited on again
+        wait = 0
+        if self._listing is None:
+            self._listing = _daemon_call(psutil.disk_partitions, name="disk-partitions")
+            wait = DISK_USAGE_DEADLINE
+        try:
+            found = self._listing.result(timeout=wait)
+        except concurrent.futures.TimeoutError:
+            if wait:
+                logging.warning("Listing partitions exceeded %.1fs; using the previous list", DISK_USAGE_DEADLINE)
+            return self._partitions
+        except OSError as e:
+            logging.warning("Listing partitions failed: %s", e)
+            found = self._partitions
+        finally:
+            if self._listing.done():
+                self._listing = None
+        # Skip CD-ROM or empty drives
+        self._partitions = [p for p in found if 'cdrom' not in p.opts and p.fstype]
+        self._signature = signature
+        self._listed_at = now
+        mounts = {p.mountpoint for p in self._partitions}
+        for cache in (self._usage, self._quarantine):
+            for mount in [m for m in cache if m not in mounts]:
+                del cache[mount]
+        return self._partitions
+
+    def collect(self):
+        now = time.monotonic()
+        partitions = self.partitions(now)
+        submitted = {}
+        for p in partitions:
+            mount = p.mountpoint
+            if mount in self._pending or self._quarantine.get(mount, 0) > now:
+                continue  # Still hung from an earlier cycle, or waiting out its quarantine
+            if mount in self._quarantine and len(self._pending) >= DISK_MAX_ABANDONED:
+                self._quarantine[mount] = now + DISK_SLOW_REFRESH  # Too many stuck calls already
+                continue
+            submitted[mount] = self._pending[mount] = _daemon_call(psutil.disk_usage, mount, name="disk-usage")
+        if submitted:
+            concurrent.futures.wait(submitted.values(), timeout=DISK_USAGE_DEADLINE)
+
+        for mount, future in list(self._pending.items()):
+            if future.done():
+                del self._pending[mount]
+                try:
+                    self._usage[mount] = (future.result(), time.monotonic())
+                except OSError as e:
+                    logging.debug("disk_usage(%s) failed: %s", mount, e)
+                if mount in submitted:
+                    self._quarantine.pop(mount, None)  # Answered within the deadline again
+            elif mount in submitted:
+                self.timeouts += 1
+                self._quarantine[mount] = now + DISK_SLOW_REFRESH
+                logging.warning("disk_usage(%s) exceeded %.1fs; quarantined for %ds",
+                                mount, DISK_USAGE_DEADLINE, DISK_SLOW_REFRESH)
+
+        disk_details = []
+        for p in partitions:
+            cached = self._usage.get(p.mountpoint)
+            if not cached:
+                continue
+            usage, read_at = cached
+            disk_details.append({
+                "mount": p.mountpoint,
+                "device": p.device,
+                "type": p.fstype,
+                "total_gb": round(usage.total / (1024**3), 2),
+                "used_gb": round(usage.used / (1024**3), 2),
+                "percent": usage.percent,
+                "stale": read_at < now,
+                "age_seconds": round(time.monotonic() - read_at) if read_at < now else 0,
+                "slow": p.mountpoint in self._quarantine,
+            })
+        return disk_details
+
+disk_inventory = DiskInventory()
+
+def get_disk_details():
+    """Per-partition usage (mount, device, type, total/used GB, percent, staleness)."""
+    try:
+        return disk_inventory.collect()
+    except Exception as e:
+        logging.error("Error collecting disk details: %s", e)
+        return []
+
+def get_network_interfaces():
+    """
+    Network Interfaces — dashboard reads hardware_info.all_details.network
+    Keys expected: interface, ip_address, mac, speed_mbps, type
+    """
+    network_interfaces = []
+    try:
+        addrs = psutil.net_if_addrs()
+        stats = psutil.net_if_stats()
+        for nic, snic_list in addrs.items():
+            if _is_loopback(nic):
+                continue
+            ip = 'N/A'
+            mac = 'N/A'
+            for snic in snic_list:
+                if snic.family == socket.AF_INET:
+                    ip = snic.address
+                elif hasattr(psutil, 'AF_LINK') and snic.family == psutil.AF_LINK:
+                    mac = snic.address
+            if ip == 'N/A':
+                continue  # Skip interfaces with no IPv4
+            nic_stats = stats.get(nic)
+            network_interfaces.append({
+                'interface': nic,
+                'ip_address': ip,
+                'mac': mac,
+                'speed_mbps': nic_stats.speed if nic_stats else 0,
+                'type': 'Wi-Fi' if 'wi-fi' in nic.lower() or 'wlan' in nic.lower() or 'wireless' in nic.lower() else 'Ethernet',
+                'is_up': nic_stats.isup if nic_stats else False,
+            })
+    except Exception as e:
+        logging.error("Error collecting network interfaces: %s", e)
+    return network_interfaces
 
 def get_system_metrics():
     try:
-        # Non-blocking CPU read (accurate after _prime_cpu() has run once)
-        cpu = psutil.cpu_percent(interval=None) if _cpu_primed else psutil.cpu_percent(interval=0.5)
-        ram = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
-        
+        core = collector_runner.run("core", _read_core_counters)
+        if core is None:
+            return None  # No core counters yet (first read overran or failed)
+        cpu, ram_percent, total_ram, uptime_seconds = core
+        disk = collector_runner.run("root_disk", lambda: psutil.disk_usage('/'))
+
         # Active Processes (Top 15 by CPU)
         # Dashboard expects: { name, cpu (float), mem (float %), mem_mb (float) }
-        total_ram = psutil.virtual_memory().total
-        processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info']):
+        top_processes = optional_collector("processes", lambda: (
+            get_top_processes_linux(total_ram, TOP_PROCESS_COUNT) if IS_LINUX
+            else get_top_processes_psutil(total_ram, TOP_PROCESS_COUNT)))
+
+        disk_details = optional_collector("disk_details", get_disk_details)
+        network_interfaces = optional_collector("network_interfaces", get_network_interfaces)
+
+        # Network Throughput: smoothed per-NIC rates published by the NIC sampler thread
+        nic_rates = nic_sampler.rates()
+        net_up = sum(up for up, _ in nic_rates.values())
+        net_down = sum(down for _, down in nic_rates.values())
+
+        return {
+            "cpu_usage": cpu,
+            "ram_usage": ram_percent,
+            "disk_total_gb": round(disk.total / (1024**3), 2) if disk else None,
+            "disk_free_gb": round(disk.free / (1024**3), 2) if disk else None,
+            "ip_address": collector_runner.run("ip_address", lambda: socket.gethostbyname(socket.gethostname())),
+            "processes": top_processes,
+            "disk_details": disk_details,
+            "network_interfaces": network_interfaces,   # New: for hardware_info.all_details.network
+            "network_up_kbps": round(net_up, 2),
+            "network_down_kbps": round(net_down, 2),
+            "network_rates": {nic: {"up_kbps": round(up, 2), "down_kbps": round(down, 2)}
+                              for nic, (up, down) in nic_rates.items()},
+            "uptime_seconds": uptime_seconds
+        }
+    except Exception as e:
+        logging.error("Error collecting metrics: %s", e)
+        return None
+
+# --- High-resolution sample history ---
+# A background sampler records the core numeric metrics at the current sample
+# cadence (1s when live or busy, stretched when idle or throttled) into a
+# fixed-size ring buffer and a per-upload window aggregate. Each sample keeps the
+# interval it was taken at. Raw samples are only uploaded when the server asks
+# for a window over Socket.IO (see hires_request).
+HIRES_SAMPLE_INTERVAL = 1  # seconds, the fastest cadence; sizes the buffer
+HIRES_HISTORY_SECONDS = 1800  # 30 minutes at the fastest cadence, longer when it is stretched
+HIRES_FIELDS = ('cpu', 'ram', 'disk', 'net_up_kbps', 'net_down_kbps')
+
+class MetricRingBuffer:
+    """
+    Fixed-memory ring buffer of numeric samples, stored column-wise in array('d'),
+    with the timestamp and sampling interval of each sample.
+    Memory is allocated once: (len(fields) + 2) * capacity * 8 bytes.
+    """
+
+    def __init__(self, capacity, fields):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self._timestamps = array('d', bytes(8 * capacity))
+        self._intervals = array('d', bytes(8 * capacity))
+        self._columns = [array('d', bytes(8 * capacity)) for _ in self.fields]
+        self._head = 0  # Next slot to write
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, values, interval=0.0):
+        """Store one sample; values are in self.fields order, interval is the cadence it was taken at."""
+        with self._lock:
+            i = self._head
+            self._timestamps[i] = timestamp
+            self._intervals[i] = interval
+            for column, value in zip(self._columns, values):
+                column[i] = value
+            self._head = (i + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def window(self, start=None, end=None, max_points=None):
+        """
+        Return samples with start <= t <= end in compact columnar form:
+        {"fields": [...], "t0": first_ts, "t": [offsets from t0], "values": [[col], ...],
+         "intervals": [seconds per sample], "interval": latest sample's interval}
+        max_points decimates evenly when the window holds more samples than that.
+        """
+        with self._lock:
+            oldest = (self._head - self._count) % self.capacity
+            indices = [(oldest + k) % self.capacity for k in range(self._count)]
+            ts = self._timestamps
+            if start is not None:
+                indices = [i for i in indices if ts[i] >= start]
+            if end is not None:
+                indices = [i for i in indices if ts[i] <= end]
+            if max_points and len(indices) > max_points:
+                stride = len(indices) / max_points
+                indices = [indices[int(k * stride)] for k in range(max_points)]
+
+            t0 = ts[indices[0]] if indices else 0
+            intervals = [round(self._intervals[i], 1) for i in indices]
+            return {
+                "fields": list(self.fields),
+                "t0": round(t0, 3),
+                "t": [round(ts[i] - t0, 1) for i in indices],
+                "values": [[round(column[i], 1) for i in indices] for column in self._columns],
+                "intervals": intervals,
+                "interval": intervals[-1] if intervals else 0,
+            }
+
+class CoreSampler:
+    """
+    Samples the HIRES_FIELDS metrics with its own delta state, so it can run on its
+    own thread without disturbing the CPU/network deltas used by get_system_metrics().
+    """
+
+    def __init__(self):
+        self._proc = None
+        if IS_LINUX:
             try:
-                pinfo = proc.info
-                mem_bytes = pinfo['memory_info'].rss if pinfo['memory_info'] else 0
-                processes.append({
-                    'name': pinfo['name'],
-                    'pid': pinfo['pid'],
-                    'cpu': round((pinfo['cpu_percent'] or 0) / psutil.cpu_count(), 1),          # Normalized by core count
-                    'mem': round((mem_bytes / total_ram * 100), 1) if total_ram else 0,
-                    'mem_mb': round(mem_bytes / (1024 * 1024), 1),
-                })
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
+                self._proc = LinuxProcCollector()
+            except OSError:
+                self._proc = None
+        self._last_cpu = None
+        self._last_net = None
+        self._last_time = None
 
-        processes.sort(key=lambda p: p['cpu'], reverse=True)
-        top_processes = processes[:15]
-        
-        # Disk Details
-        disk_details = []
+    def _cpu_percent(self):
+        # psutil.cpu_percent(interval=None) keeps module-global state, so use raw times
+        times = psutil.cpu_times()
+        total = sum(times) - getattr(times, 'guest', 0) - getattr(times, 'guest_nice', 0)
+        busy = total - times.idle - getattr(times, 'iowait', 0)
+        percent = 0.0
+        if self._last_cpu:
+            total_delta = total - self._last_cpu[0]
+            if total_delta > 0:
+                percent = min(max((busy - self._last_cpu[1]) / total_delta * 100, 0.0), 100.0)
+        self._last_cpu = (total, busy)
+        return percent
+
+    def sample(self):
+        now = time.monotonic()
+        if self._proc:
+            fast = self._proc.collect()
+            cpu = fast["cpu_percent"]
+            ram = fast["ram_percent"]
+            net = (fast["net_bytes_sent"], fast["net_bytes_recv"])
+        else:
+            cpu = self._cpu_percent()
+            ram = psutil.virtual_memory().percent
+            nics = _read_nic_counters().values()  # Excludes loopback, like the NIC sampler
+            net = (sum(c[0] for c in nics), sum(c[1] for c in nics))
+        disk = psutil.disk_usage('/').percent
+
+        net_up = net_down = 0.0
+        if self._last_net and now > self._last_time:
+            elapsed = now - self._last_time
+            net_up = max(net[0] - self._last_net[0], 0) / elapsed / 1024
+            net_down = max(net[1] - self._last_net[1], 0) / elapsed / 1024
+        self._last_net = net
+        self._last_time = now
+        return (cpu, ram, disk, net_up, net_down)
+
+class WindowAggregator:
+    """
+    Running min/max/mean/last per field for the samples taken since the last upload,
+    so short spikes between uploads are still reported.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        n = len(self.fields)
+        self._count = 0
+        self._min = [0.0] * n
+        self._max = [0.0] * n
+        self._sum = [0.0] * n
+        self._last = [0.0] * n
+        self._first_ts = None
+        self._last_ts = None
+
+    def add(self, timestamp, values):
+        with self._lock:
+            if self._count == 0:
+                self._min = list(values)
+                self._max = list(values)
+                self._first_ts = timestamp
+            else:
+                for i, value in enumerate(values):
+                    if value < self._min[i]:
+                        self._min[i] = value
+                    if value > self._max[i]:
+                        self._max[i] = value
+            for i, value in enumerate(values):
+                self._sum[i] += value
+            self._last = list(values)
+            self._last_ts = timestamp
+            self._count += 1
+
+    def snapshot(self, reset=True):
+        """Return {"samples", "seconds", <field>: {min, max, mean, last}} or None if empty."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            stats = {
+                "samples": self._count,
+                "seconds": round(self._last_ts - self._first_ts, 1),
+            }
+            for i, field in enumerate(self.fields):
+                stats[field] = {
+                    "min": round(self._min[i], 1),
+                    "max": round(self._max[i], 1),
+                    "mean": round(self._sum[i] / self._count, 1),
+                    "last": round(self._last[i], 1),
+                }
+            if reset:
+                self._reset()
+            return stats
+
+hires_buffer = MetricRingBuffer(HIRES_HISTORY_SECONDS // HIRES_SAMPLE_INTERVAL, HIRES_FIELDS)
+window_aggregator = WindowAggregator(HIRES_FIELDS)
+
+# --- Load-adaptive cadence ---
+# Defaults; any key can be overridden with an "adaptive_sampling" object in config.json
+ADAPTIVE_SAMPLING_DEFAULTS = {
+    "enabled": True,
+    # Cadence levels, fastest first: seconds between samples and between uploads
+    "levels": [
+        {"mode": "busy", "sample_interval": 1, "upload_interval": 5},
+        {"mode": "normal", "sample_interval": 1, "upload_interval": TELEMETRY_INTERVAL},
+        {"mode": "idle", "sample_interval": 5, "upload_interval": 30},
+    ],
+    # Window peak at or above a *_high band (or a fast change) switches to "busy" immediately
+    "cpu_high": 80, "ram_high": 90, "net_high_kbps": 10240,
+    # Window peak at or below every *_low band counts as a calm window
+    "cpu_low": 20, "ram_low": 75, "net_low_kbps": 256,
+    # Change in CPU/RAM mean between windows (percentage points) that counts as changing fast
+    "change_high": 25,
+    # Hysteresis: consecutive qualifying windows required before slowing down one level
+    "slowdown_windows": 6,
+}
+
+class AdaptiveCadence:
+    """
+    Chooses sample and upload intervals from the load seen in each upload window.
+    Speeds up at once when a band is crossed or metrics jump, and only slows down
+    one level after several consecutive calm windows, so it does not oscillate.
+    """
+
+    def __init__(self, settings=None):
+        self.configure(settings)
+
+    def configure(self, settings=None):
+        self.settings = dict(ADAPTIVE_SAMPLING_DEFAULTS)
+        if settings:
+            self.settings.update(settings)
+        self.levels = self.settings["levels"]
+        self.level = min(1, len(self.levels) - 1)  # Start at "normal"
+        self._calm_windows = 0
+        self._last_means = None
+
+    @property
+    def mode(self):
+        return self.levels[self.level]["mode"]
+
+    @property
+    def sample_interval(self):
+        return self.levels[self.level]["sample_interval"]
+
+    @property
+    def upload_interval(self):
+        return self.levels[self.level]["upload_interval"]
+
+    def update(self, window):
+        """Feed one window of WindowAggregator stats; returns the (possibly new) mode."""
+        cfg = self.settings
+        if not cfg["enabled"] or not window:
+            return self.mode
+
+        cpu_max = window["cpu"]["max"]
+        ram_max = window["ram"]["max"]
+        net_max = max(window["net_up_kbps"]["max"], window["net_down_kbps"]["max"])
+        means = (window["cpu"]["mean"], window["ram"]["mean"])
+        change = 0.0
+        if self._last_means:
+            change = max(abs(means[0] - self._last_means[0]), abs(means[1] - self._last_means[1]))
+        self._last_means = means
+
+        hot = (cpu_max >= cfg["cpu_high"] or ram_max >= cfg["ram_high"]
+               or net_max >= cfg["net_high_kbps"] or change >= cfg["change_high"])
+        calm = (cpu_max <= cfg["cpu_low"] and ram_max <= cfg["ram_low"]
+                and net_max <= cfg["net_low_kbps"] and change < cfg["change_high"] / 2)
+
+        previous = self.mode
+        if hot:
+            self.level = 0
+            self._calm_windows = 0
+        elif self.level == 0 or calm:
+            # Leaving "busy" only needs the bands to be clear; going idle needs calm windows
+            self._calm_windows += 1
+            if self._calm_windows >= cfg["slowdown_windows"] and self.level < len(self.levels) - 1:
+                self.level += 1
+                self._calm_windows = 0
+        else:
+            # Moderate load: leave idle right away, otherwise hold the current level
+            self._calm_windows = 0
+            if self.level == len(self.levels) - 1 and self.level > 1:
+                self.level = 1
+
+        if self.mode != previous:
+            logging.info("Cadence: %s -> %s (sample %ss, upload %ss)", previous, self.mode, self.sample_interval, self.upload_interval)
+        return self.mode
+
+adaptive_cadence = AdaptiveCadence()
+
+# --- Viewer-driven live mode ---
+# While a dashboard user has this machine open the server grants a live lease:
+# sample and upload every second until the lease expires or is revoked.
+LIVE_INTERVAL = 1  # seconds
+LIVE_MAX_LEASE = 300  # seconds, upper bound on a single server grant
+_live_until = 0.0  # monotonic deadline of the current lease
+_cadence_changed = threading.Event()  # Wakes the telemetry loop early when live mode starts
+
+def is_live():
+    return time.monotonic() < _live_until
+
+def current_sample_interval():
+    return LIVE_INTERVAL if is_live() else adaptive_cadence.sample_interval * resource_governor.stretch
+
+def current_upload_interval():
+    if is_live():
+        return LIVE_INTERVAL
+    return max(adaptive_cadence.upload_interval * resource_governor.stretch, send_pacing.server_min_interval)
+
+# --- Self resource governor ---
+# Keeps the agent from becoming a top process: it runs at lowered CPU/I/O priority,
+# measures its own CPU share per upload window and, over budget, stretches the
+# cadence and serves optional collectors from their last value.
+RESOURCE_GOVERNOR_DEFAULTS = {
+    "enabled": True,
+    "cpu_budget_percent": 1.0,  # Of one core, averaged over an upload window
+    "lower_priority": True,
+    "relax_windows": 3,         # Consecutive windows under half the budget before relaxing one level
+}
+# Throttle ladder: interval multiplier and collectors served from their last value
+GOVERNOR_LEVELS = (
+    {"stretch": 1, "skip": ()},
+    {"stretch": 2, "skip": ()},
+    {"stretch": 2, "skip": ("network_interfaces", "disk_details")},
+    {"stretch": 4, "skip": ("network_interfaces", "disk_details", "processes")},
+)
+
+_original_priority = None  # (nice, ionice) before lower_own_priority(); restored for exec_command children
+
+def lower_own_priority():
+    """Drop the agent to below-normal CPU priority and low/idle I/O priority; returns what was applied."""
+    global _original_priority
+    applied = []
+    try:
+        proc = psutil.Process()
+        _original_priority = (proc.nice(), proc.ionice())
+        if platform.system() == 'Windows':
+            proc.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            applied.append("cpu:below_normal")
+            proc.ionice(psutil.IOPRIO_VERYLOW)
+            applied.append("io:very_low")
+        else:
+            if proc.nice() < 10:
+                proc.nice(10)
+            applied.append(f"cpu:nice{proc.nice()}")
+            if hasattr(psutil, "IOPRIO_CLASS_IDLE"):
+                proc.ionice(psutil.IOPRIO_CLASS_IDLE)
+                applied.append("io:idle")
+    except (psutil.Error, OSError, AttributeError, ValueError) as e:
+        logging.warning("Could not lower agent priority: %s", e)
+    return applied
+
+def restore_child_priority(pid):
+    """
+    Give a child the CPU/I/O priority the agent had before lower_own_priority(),
+    which children otherwise inherit (remote admin commands would run starved).
+    Raising priority again may need admin/root; failures are logged only.
+    """
+    if _original_priority is None:
+        return
+    nice, ionice = _original_priority
+    try:
+        child = psutil.Process(pid)
+        child.nice(nice)
+        if platform.system() == 'Windows':
+            child.ionice(ionice)
+        else:
+            child.ionice(ionice.ioclass, ionice.value)
+    except (psutil.Error, OSError, AttributeError, ValueError) as e:
+        logging.warning("Could not restore priority of child %d: %s", pid, e)
+
+class ResourceGovernor:
+    """
+    Measures the agent's own CPU time (all threads) per window and walks
+    GOVERNOR_LEVELS: one level up as soon as a window is over budget, one level
+    down after relax_windows calm windows.
+    """
+    def __init__(self):
+        self.settings = dict(RESOURCE_GOVERNOR_DEFAULTS)
+        self.level = 0
+        self.priority = []
+        self.cpu_percent = 0.0
+        self._calm_windows = 0
+        self._last = None  # (wall, cpu) at the previous update
+
+    def configure(self, overrides=None):
+        self.settings = dict(RESOURCE_GOVERNOR_DEFAULTS)
+        if isinstance(overrides, dict):
+            self.settings.update({k: v for k, v in overrides.items() if k in RESOURCE_GOVERNOR_DEFAULTS})
+        if self.settings["enabled"] and self.settings["lower_priority"] and not self.priority:
+            self.priority = lower_own_priority()
+        self._last = (time.monotonic(), time.process_time())
+
+    @property
+    def stretch(self):
+        return GOVERNOR_LEVELS[self.level]["stretch"]
+
+    def skips(self, collector):
+        return collector in GOVERNOR_LEVELS[self.level]["skip"]
+
+    def update(self, hold=False):
+        """Close the current window; returns the (possibly new) level. hold measures without changing it."""
+        wall, cpu = time.monotonic(), time.process_time()
+        if self._last is None:
+            self._last = (wall, cpu)
+            return self.level
+        elapsed = wall - self._last[0]
+        if elapsed <= 0:
+            return self.level
+        self.cpu_percent = (cpu - self._last[1]) / elapsed * 100
+        self._last = (wall, cpu)
+        if not self.settings["enabled"] or hold:
+            return self.level
+
+        budget = self.settings["cpu_budget_percent"]
+        previous = self.level
+        if self.cpu_percent > budget:
+            self._calm_windows = 0
+            self.level = min(self.level + 1, len(GOVERNOR_LEVELS) - 1)
+        elif self.cpu_percent < budget / 2 and self.level > 0:
+            self._calm_windows += 1
+            if self._calm_windows >= self.settings["relax_windows"]:
+                self._calm_windows = 0
+                self.level -= 1
+        else:
+            self._calm_windows = 0
+
+        if self.level != previous:
+            logging.info("Governor: own CPU %.2f%% (budget %.2f%%), level %d -> %d (stretch x%d, skip %s)",
+                         self.cpu_percent, budget, previous, self.level, self.stretch,
+                         ", ".join(GOVERNOR_LEVELS[self.level]["skip"]) or "none")
+        return self.level
+
+    def status(self):
+        """Telemetry block describing the current throttling decision."""
+        return {
+            "cpu_percent": round(self.cpu_percent, 2),
+            "budget_percent": self.settings["cpu_budget_percent"],
+            "level": self.level,
+            "stretch": self.stretch,
+            "skipped": list(GOVERNOR_LEVELS[self.level]["skip"]),
+            "priority": self.priority,
+        }
+
+resource_governor = ResourceGovernor()
+
+# --- Collector deadlines ---
+# Collectors run on daemon threads, each under its own hard deadline, so one slow
+# call (a WMI query, a DNS lookup, a hung partition) no longer stalls the cycle.
+# An overrunning call is left to finish (or hang) in the background and is not
+# resubmitted until it returns; meanwhile the cycle uses its last good value and
+# reports it under metrics["collectors"]["stale"].
+COLLECTOR_DEADLINE_DEFAULTS = {
+    "core": 2.0,                # cpu / ram / uptime counters
+    "root_disk": 2.0,           # disk_usage('/') for the headline disk numbers
+    "ip_address": 1.0,          # gethostbyname(): a DNS lookup on some networks
+    "processes": 3.0,
+    "disk_details": 5.0,        # DiskInventory also applies per-mount deadlines inside
+    "network_interfaces": 2.0,
+    "events": 10.0,             # Windows event log query
+}
+COLLECTOR_DEFAULT_DEADLINE = 2.0
+
+class CollectorRunner:
+    """Runs collectors under per-collector deadlines with last-good-value fallback."""
+    def __init__(self):
+        self.deadlines = dict(COLLECTOR_DEADLINE_DEFAULTS)
+        self.inline = False        # Run on the calling thread, no deadline (profiling)
+        self._pending = {}         # name -> call still running after its deadline
+        self._last = {}            # name -> (last good value, monotonic time)
+        self._stale = {}           # name -> age in seconds of the value served instead (None: none yet)
+        self.overruns = collections.Counter()
+        self.errors = collections.Counter()
+
+    def configure(self, overrides=None):
+        self.deadlines = dict(COLLECTOR_DEADLINE_DEFAULTS)
+        if isinstance(overrides, dict):
+            self.deadlines.update({k: float(v) for k, v in overrides.items() if k in COLLECTOR_DEADLINE_DEFAULTS})
+
+    def _submit(self, name, fn):
+        # Daemon thread per call (run() keeps one in flight per collector), so a
+        # collector hung in a syscall never blocks interpreter exit or a restart
+        return _daemon_call(fn, name=f"collector-{name}")
+
+    def run(self, name, fn, default=None, reuse_last=True):
+        """
+        Return fn()'s result, or, when it overruns or fails, the last good value
+        (default when there is none, or when reuse_last is False - e.g. events,
+        which must not be sent twice).
+        """
+        if self.inline:
+            return fn()
+        pending = self._pending.pop(name, None)
+        if pending is not None:
+            if not pending.done():
+                self._pending[name] = pending  # Still running: don't stack another call on it
+                return self._fallback(name, default, reuse_last)
+            if reuse_last and not pending.cancelled() and pending.exception() is None:
+                self._last[name] = (pending.result(), time.monotonic())  # Finished late
+
+        deadline = self.deadlines.get(name, COLLECTOR_DEFAULT_DEADLINE)
+        future = self._submit(name, fn)
         try:
-            partitions = psutil.disk_partitions()
-            for p in partitions:
-                try:
-                    # Skip CD-ROM or empty drives
-                    if 'cdrom' in p.opts or p.fstype == '': continue
-                    usage = psutil.disk_usage(p.mountpoint)
-                    disk_details.append({
-                        "mount": p.mountpoint,
-                        "device": p.device,
-                        "type": p.fstype,
-                        "total_gb": round(usage.total / (1024**3), 2),
-                        "used_gb": round(usage.used / (1024**3), 2),
-                        "percent": usage.percent
-                    })
-                except: pass
-        except: pass
+            value = future.result(timeout=deadline)
+        except concurrent.futures.TimeoutError:
+            self.overruns[name] += 1
+            self._pending[name] = future
+            logging.warning("Collector %s exceeded its %.1fs deadline (%d overrun(s)); using its last value",
+                            name, deadline, self.overruns[name])
+            return self._fallback(name, default, reuse_last)
+        except Exception as e:
+            self.errors[name] += 1
+            logging.error("Collector %s failed: %s", name, e)
+            return self._fallback(name, default, reuse_last)
+        if reuse_last:
+            self._last[name] = (value, time.monotonic())
+        self._stale.pop(name, None)
+        return value
+
+    def _fallback(self, name, default, reuse_last):
+        last = self._last.get(name) if reuse_last else None
+        if last is None:
+            self._stale[name] = None
+            return default
+        self._stale[name] = round(time.monotonic() - last[1])
+        return last[0]
+
+    def status(self):
+        """Telemetry block: overrun counts per collector and the stale values served."""
+        status = {"overruns": dict(self.overruns), "stale": dict(self._stale)}
+        if self.errors:
+            status["errors"] = dict(self.errors)
+        if self._pending:
+            status["running"] = sorted(self._pending)
+        return status
+
+collector_runner = CollectorRunner()
+
+_last_optional = {}  # collector name -> last value, served while the governor skips it
+
+def optional_collector(name, collect):
+    """Run an optional collector under its deadline, or return its last value while the governor is skipping it."""
+    if resource_governor.skips(name) and name in _last_optional:
+        return _last_optional[name]
+    value = collector_runner.run(name, collect, default=[])
+    _last_optional[name] = value
+    return value
+
+# --- Edge alert evaluation ---
+# The server pushes its threshold policies (alert_rules); they are evaluated here
+# against every local sample, and only firing/clearing transitions are sent back.
+EDGE_ALERT_CLEAR_SECONDS = 15  # Condition must stay cleared (past the hysteresis band) this long
+EDGE_ALERT_QUEUE_LIMIT = 100  # Undelivered transitions kept for the next telemetry upload
+
+class EdgeAlertEvaluator:
+    """
+    Evaluates server alert rules on every sample with a duration window (the rule must
+    hold continuously for duration_seconds before firing) and hysteresis (a firing rule
+    clears only after the value is back past threshold -/+ margin for EDGE_ALERT_CLEAR_SECONDS).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = []
+        self._state = {}  # rule id -> {"firing", "since", "clear_since"}
+
+    def load(self, rules):
+        with self._lock:
+            previous = {r["id"]: r for r in self._rules}
+            self._rules = [r for r in rules if r.get("metric") in ("cpu", "ram", "disk", "network")]
+            # Keep state for unchanged rules so a rule push does not re-fire active alerts
+            self._state = {
+                r["id"]: self._state[r["id"]] for r in self._rules
+                if r["id"] in self._state and previous.get(r["id"], {}).get("threshold") == r.get("threshold")
+                and previous.get(r["id"], {}).get("operator") == r.get("operator")
+            }
+            return len(self._rules)
+
+    def export_state(self):
+        """Rules and per-rule state, JSON-serializable (used across a restart)."""
+        with self._lock:
+            return {"rules": list(self._rules), "state": [[rule_id, dict(st)] for rule_id, st in self._state.items()]}
+
+    def import_state(self, saved):
+        with self._lock:
+            self._rules = list(saved.get("rules", []))
+            self._state = {rule_id: st for rule_id, st in saved.get("state", [])}
+
+    @staticmethod
+    def _breached(operator, value, threshold):
+        if operator == '>':
+            return value > threshold
+        if operator == '<':
+            return value < threshold
+        if operator == '=':
+            return value == threshold
+        return False
+
+    @staticmethod
+    def _cleared(operator, value, threshold, margin):
+        if operator == '>':
+            return value < threshold - margin
+        if operator == '<':
+            return value > threshold + margin
+        return value != threshold
+
+    def evaluate(self, timestamp, values):
+        """Check one sample (HIRES_FIELDS order); returns a list of transition events."""
+        cpu, ram, disk, net_up, net_down = values
+        current = {"cpu": cpu, "ram": ram, "disk": disk, "network": net_up + net_down}
+        transitions = []
+        with self._lock:
+            for rule in self._rules:
+                value = current[rule["metric"]]
+                threshold = float(rule["threshold"])
+                state = self._state.setdefault(rule["id"], {"firing": False, "since": None, "clear_since": None})
+
+                if not state["firing"]:
+                    if self._breached(rule["operator"], value, threshold):
+                        if state["since"] is None:
+                            state["since"] = timestamp
+                        if timestamp - state["since"] >= float(rule.get("duration_seconds") or 0):
+                            state["firing"] = True
+                            state["clear_since"] = None
+                            transitions.append(self._event(rule, "firing", value, timestamp))
+                    else:
+                        state["since"] = None
+                else:
+                    margin = float(rule.get("hysteresis", max(abs(threshold) * 0.05, 1.0)))
+                    if self._cleared(rule["operator"], value, threshold, margin):
+                        if state["clear_since"] is None:
+                            state["clear_since"] = timestamp
+                        if timestamp - state["clear_since"] >= EDGE_ALERT_CLEAR_SECONDS:
+                            state["firing"] = False
+                            state["since"] = None
+                            transitions.append(self._event(rule, "cleared", value, timestamp))
+                    else:
+                        state["clear_since"] = None
+        return transitions
+
+    @staticmethod
+    def _event(rule, state, value, timestamp):
+        return {
+            "policy_id": rule["id"],
+            "name": rule.get("name"),
+            "priority": rule.get("priority"),
+            "state": state,
+            "value": round(value, 1),
+            "timestamp": datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat(),
+        }
+
+edge_alerts = EdgeAlertEvaluator()
+EDGE_ALERT_ACK_TIMEOUT = 10  # Seconds to wait for the server's ack before re-queueing a transition
+_pending_alert_events = collections.deque(maxlen=EDGE_ALERT_QUEUE_LIMIT)
+_unacked_alert_events = {}  # key -> (event, monotonic deadline); popped by the ack callback
+
+def dispatch_alert_events(transitions):
+    """
+    Send transitions right away over Socket.IO. Each emit waits for the server's ack
+    in the background; unacked (or unsent) ones go out with the next upload instead.
+    """
+    for event in transitions:
+        logging.warning("Edge alert %s: %s (value %s)", event['state'], event['name'], event['value'])
+        delivered = False
+        if sio is not None and sio.connected:
+            key = f"{event['policy_id']}:{event['state']}:{event['timestamp']}"
+            _unacked_alert_events[key] = (event, time.monotonic() + EDGE_ALERT_ACK_TIMEOUT)
+            try:
+                sio.emit('alert_event', event, callback=lambda *_, key=key: _unacked_alert_events.pop(key, None))
+                delivered = True
+            except Exception as e:
+                _unacked_alert_events.pop(key, None)
+                logging.error("Failed to emit alert event: %s", e)
+        if not delivered:
+            _pending_alert_events.append(event)
+
+def _requeue_unacked_alert_events(force=False):
+    """Move transitions whose ack never arrived back onto the upload queue."""
+    now = time.monotonic()
+    for key, (event, deadline) in list(_unacked_alert_events.items()):
+        if (force or deadline <= now) and _unacked_alert_events.pop(key, None):
+            _pending_alert_events.append(event)
+
+def drain_pending_alert_events():
+    _requeue_unacked_alert_events()
+    events = []
+    while _pending_alert_events:
+        events.append(_pending_alert_events.popleft())
+    return events
+
+def _hires_sampler_loop():
+    """Record one sample per cadence interval on a drift-free monotonic schedule."""
+    sampler = CoreSampler()
+    sampler.sample()  # Baseline for CPU and network deltas
+    interval = current_sample_interval()
+    next_tick = time.monotonic() + interval
+    while True:
+        time.sleep(max(next_tick - time.monotonic(), 0))
+        try:
+            now = time.time()
+            values = sampler.sample()
+            hires_buffer.append(now, values, interval)
+            window_aggregator.add(now, values)
+            transitions = edge_alerts.evaluate(now, values)
+            if transitions:
+                dispatch_alert_events(transitions)
+        except Exception as e:
+            logging.error("High-resolution sampler error: %s", e)
+        interval = current_sample_interval()
+        next_tick += interval
+        if next_tick < time.monotonic():
+            next_tick = time.monotonic() + interval  # Skip missed ticks after a stall
+
+def start_hires_sampler():
+    threading.Thread(target=_hires_sampler_loop, name="hires-sampler", daemon=True).start()
+
+def run_wmic(command):
+    try:
+        # Run wmic command and return output as list of lines
+        result = subprocess.check_output(command, shell=True).decode('utf-8', errors='ignore')
+        lines = [line.strip() for line in result.split('\n') if line.strip()]
+        if len(lines) > 1:
+            return lines[1:] # Skip header
+        return []
+    except:
+        return []
+
+# --- Linux hardware inventory (sysfs / DMI, no subprocesses) ---
+SYS_DMI_ID = '/sys/class/dmi/id'
+SYS_DMI_ENTRIES = '/sys/firmware/dmi/entries'
+
+# SMBIOS type 17 "Form Factor" values
+DMI_FORM_FACTORS = {
+    0x03: 'SIMM', 0x08: 'DIP', 0x09: 'DIMM', 0x0B: 'RIMM', 0x0C: 'SODIMM',
+    0x0D: 'SRIMM', 0x0E: 'FB-DIMM', 0x0F: 'Die',
+}
+
+def _read_sysfs(path, default=None):
+    """Read a sysfs/procfs attribute as stripped text, or default when missing/unreadable."""
+    try:
+        with open(path, 'r', errors='ignore') as f:
+            value = f.read().strip()
+        return value or default
+    except OSError:
+        return default
+
+def _read_dmi_structures(dmi_type):
+    """
+    Parse raw SMBIOS structures of one type from /sys/firmware/dmi/entries.
+    Returns (formatted_area, strings) pairs; strings are indexed from 1 per SMBIOS.
+    Needs root, like dmidecode, so callers must tolerate an empty result.
+    """
+    structures = []
+    try:
+        entries = sorted(e for e in os.listdir(SYS_DMI_ENTRIES) if e.startswith(f'{dmi_type}-'))
+    except OSError:
+        return structures
+    for entry in entries:
+        try:
+            with open(os.path.join(SYS_DMI_ENTRIES, entry, 'raw'), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            continue
+        if len(raw) < 2:
+            continue
+        length = raw[1]
+        strings = [''] + [s.decode('utf-8', errors='ignore').strip() for s in raw[length:].split(b'\0')]
+        structures.append((raw[:length], strings))
+    return structures
+
+def _dmi_string(strings, index):
+    return strings[index] if 0 < index < len(strings) else ''
+
+def _linux_motherboard_info():
+    manufacturer = _read_sysfs(os.path.join(SYS_DMI_ID, 'board_vendor'))
+    product = _read_sysfs(os.path.join(SYS_DMI_ID, 'board_name'))
+    if not manufacturer and not product:
+        return {}
+    return {
+        'manufacturer': manufacturer or 'Unknown',
+        'product': product or 'Unknown',
+        'serial': _read_sysfs(os.path.join(SYS_DMI_ID, 'board_serial'), 'N/A'),  # root-only
+        'version': _read_sysfs(os.path.join(SYS_DMI_ID, 'board_version'), 'N/A'),
+    }
+
+def _linux_cpu_info():
+    name = None
+    logical = 0
+    flags = ''
+    cores = set()
+    sockets = set()
+    physical_id = core_id = None
+    try:
+        with open('/proc/cpuinfo', 'r', errors='ignore') as f:
+            for line in f:
+                key, sep, value = line.partition(':')
+                if not sep:
+                    # Blank line ends one logical processor block
+                    if physical_id is not None or core_id is not None:
+                        cores.add((physical_id, core_id))
+                    physical_id = core_id = None
+                    continue
+                key = key.strip()
+                value = value.strip()
+                if key == 'processor':
+                    logical += 1
+                elif key == 'model name' and not name:
+                    name = value
+                elif key == 'physical id':
+                    physical_id = value
+                    sockets.add(value)
+                elif key == 'core id':
+                    core_id = value
+                elif key == 'flags' and not flags:
+                    flags = value
+        if physical_id is not None or core_id is not None:
+            cores.add((physical_id, core_id))
+    except OSError:
+        return {}
+
+    flag_set = set(flags.split())
+    if 'vmx' in flag_set:
+        virtualization = 'VT-x'
+    elif 'svm' in flag_set:
+        virtualization = 'AMD-V'
+    else:
+        virtualization = 'N/A'
+
+    # SMBIOS type 4: Socket Designation is string index at offset 0x04
+    socket_name = 'N/A'
+    for area, strings in _read_dmi_structures(4):
+        if len(area) > 0x04 and _dmi_string(strings, area[0x04]):
+            socket_name = _dmi_string(strings, area[0x04])
+            break
+    if socket_name == 'N/A' and sockets:
+        socket_name = f"{len(sockets)} socket(s)"
+
+    return {
+        'name': name or platform.processor() or 'Unknown CPU',
+        'cores': len(cores) or logical or 'N/A',
+        'logical': logical or 'N/A',
+        'socket': socket_name,
+        'virtualization': virtualization,
+    }
+
+def _linux_ram_modules():
+    modules = []
+    # 1. SMBIOS type 17 (Memory Device) — same source wmic memorychip uses on Windows
+    for area, strings in _read_dmi_structures(17):
+        if len(area) < 0x15:
+            continue
+        size = int.from_bytes(area[0x0C:0x0E], 'little')
+        if size == 0 or size == 0xFFFF:
+            continue  # Empty slot / unknown
+        if size == 0x7FFF and len(area) >= 0x20:
+            size_mb = int.from_bytes(area[0x1C:0x20], 'little') & 0x7FFFFFFF
+        elif size & 0x8000:
+            size_mb = (size & 0x7FFF) // 1024  # KB granularity
+        else:
+            size_mb = size
+        speed = int.from_bytes(area[0x15:0x17], 'little') if len(area) >= 0x17 else 0
+        modules.append({
+            'capacity': f"{size_mb // 1024} GB" if size_mb >= 1024 else f"{size_mb} MB",
+            'speed': f"{speed} MHz" if speed else 'N/A',
+            'manufacturer': _dmi_string(strings, area[0x17]) if len(area) > 0x17 else '',
+            'part_number': _dmi_string(strings, area[0x1A]) if len(area) > 0x1A else '',
+            'form_factor': DMI_FORM_FACTORS.get(area[0x0E], 'N/A'),
+        })
+    if modules:
+        return modules
 
-        # Network Interfaces — dashboard reads hardware_info.all_details.network
-        # Keys expected: interface, ip_address, mac, speed_mbps, type
-        network_interfaces = []
+    # 2. EDAC memory controller attributes (servers with ECC drivers loaded)
+    edac_root = '/sys/devices/system/edac/mc'
+    try:
+        controllers = sorted(os.listdir(edac_root))
+    except OSError:
+        controllers = []
+    for mc in controllers:
+        mc_path = os.path.join(edac_root, mc)
         try:
-            addrs = psutil.net_if_addrs()
-            stats = psutil.net_if_stats()
-            for nic, snic_list in addrs.items():
-                if nic.lower() in ('lo', 'loopback') or nic.lower().startswith('loop'):
-                    continue
-                ip = 'N/A'
-                mac = 'N/A'
-                for snic in snic_list:
-                    if snic.family == socket.AF_INET:
-                        ip = snic.address
-                    elif hasattr(psutil, 'AF_LINK') and snic.family == psutil.AF_LINK:
-                        mac = snic.address
-                if ip == 'N/A':
-                    continue  # Skip interfaces with no IPv4
-                nic_stats = stats.get(nic)
-                network_interfaces.append({
-                    'interface': nic,
-                    'ip_address': ip,
-                    'mac': mac,
-                    'speed_mbps': nic_stats.speed if nic_stats else 0,
-                    'type': 'Wi-Fi' if 'wi-fi' in nic.lower() or 'wlan' in nic.lower() or 'wireless' in nic.lower() else 'Ethernet',
-                    'is_up': nic_stats.isup if nic_stats else False,
-                })
-        except Exception as e:
-            logging.error(f"Error collecting network interfaces: {e}")
+            dimms = sorted(d for d in os.listdir(mc_path) if d.startswith(('dimm', 'rank')))
+        except OSError:
+            continue
+        for dimm in dimms:
+            size_mb = _read_sysfs(os.path.join(mc_path, dimm, 'size'))
+            if not size_mb or not size_mb.isdigit() or int(size_mb) == 0:
+                continue
+            size_mb = int(size_mb)
+            modules.append({
+                'capacity': f"{size_mb // 1024} GB" if size_mb >= 1024 else f"{size_mb} MB",
+                'speed': 'N/A',
+                'manufacturer': _read_sysfs(os.path.join(mc_path, dimm, 'dimm_label'), ''),
+                'part_number': _read_sysfs(os.path.join(mc_path, dimm, 'dimm_mem_type'), ''),
+                'form_factor': 'DIMM',
+            })
+    return modules
 
-        # Network Throughput
-        global last_net_io, last_net_time
-        net_up = 0
-        net_down = 0
-        current_net_io = psutil.net_io_counters()
-        current_time = time.time()
+def _linux_physical_drives():
+    drives = []
+    try:
+        devices = sorted(os.listdir('/sys/block'))
+    except OSError:
+        return drives
+    for dev in devices:
+        # Skip virtual/ephemeral block devices
+        if dev.startswith(('loop', 'ram', 'zram', 'dm-', 'md', 'sr', 'nbd', 'fd')):
+            continue
+        base = os.path.join('/sys/block', dev)
+        sectors = _read_sysfs(os.path.join(base, 'size'))
+        if not sectors or not sectors.isdigit() or int(sectors) == 0:
+            continue
+        size_bytes = int(sectors) * 512  # sysfs size is always in 512-byte sectors
+        if size_bytes >= 1024**4:
+            size_str = f"{round(size_bytes / (1024**4), 2)} TB"
+        else:
+            size_str = f"{round(size_bytes / (1024**3), 2)} GB"
 
-        if last_net_io and last_net_time:
-            time_diff = current_time - last_net_time
-            if time_diff > 0:
-                net_up = (current_net_io.bytes_sent - last_net_io.bytes_sent) / time_diff / 1024
-                net_down = (current_net_io.bytes_recv - last_net_io.bytes_recv) / time_diff / 1024
+        vendor = _read_sysfs(os.path.join(base, 'device', 'vendor'), '')
+        model = _read_sysfs(os.path.join(base, 'device', 'model'), '')
+        if vendor and not model.startswith(vendor) and not vendor.startswith('0x'):
+            model = f"{vendor} {model}".strip()
 
-        last_net_io = current_net_io
-        last_net_time = current_time
+        # NVMe exposes device/serial, virtio exposes serial, SCSI/SATA only the VPD page 0x80
+        serial = _read_sysfs(os.path.join(base, 'device', 'serial')) or _read_sysfs(os.path.join(base, 'serial'))
+        if not serial:
+            try:
+                with open(os.path.join(base, 'device', 'vpd_pg80'), 'rb') as f:
+                    serial = f.read()[4:].decode('ascii', errors='ignore').strip() or None
+            except OSError:
+                serial = None
 
-        return {
-            "cpu_usage": cpu,
-            "ram_usage": ram.percent,
-            "disk_total_gb": round(disk.total / (1024**3), 2),
-            "disk_free_gb": round(disk.free / (1024**3), 2),
-            "ip_address": socket.gethostbyname(socket.gethostname()),
-            "processes": top_processes,
-            "disk_details": disk_details,
-            "network_interfaces": network_interfaces,   # New: for hardware_info.all_details.network
-            "network_up_kbps": round(net_up, 2),
-            "network_down_kbps": round(net_down, 2),
-            "uptime_seconds": int(time.time() - psutil.boot_time())
-        }
-    except Exception as e:
-        logging.error(f"Error collecting metrics: {e}")
-        return None
+        drives.append({
+            'model': model or dev,
+            'serial': serial or 'N/A',
+            'size': size_str,
+        })
+    return drives
 
-def run_wmic(command):
+# Hardware inventory is static, so it is collected once per process
+_linux_hardware_info = None
+_linux_hardware_collected = False
+
+def get_linux_hardware_info():
+    """Linux equivalent of the wmic inventory, read directly from sysfs, DMI and /proc."""
+    global _linux_hardware_info, _linux_hardware_collected
+    if _linux_hardware_collected:
+        return _linux_hardware_info
+
+    info = {
+        'motherboard': {},
+        'cpu': {},
+        'ram': {'modules': [], 'slots_used': 0}
+    }
     try:
-        # Run wmic command and return output as list of lines
-        result = subprocess.check_output(command, shell=True).decode('utf-8', errors='ignore')
-        lines = [line.strip() for line in result.split('\n') if line.strip()]
-        if len(lines) > 1:
-            return lines[1:] # Skip header
-        return []
-    except:
-        return []
+        info['motherboard'] = _linux_motherboard_info()
+    except Exception as e:
+        logging.error("MB Error: %s", e)
+    try:
+        info['cpu'] = _linux_cpu_info()
+    except Exception as e:
+        logging.error("CPU Error: %s", e)
+    try:
+        modules = _linux_ram_modules()
+        if not modules:
+            # Fallback: a single module with the total size, as on Windows
+            total_ram = round(psutil.virtual_memory().total / (1024**3), 2)
+            modules = [{
+                'capacity': f"{total_ram} GB",
+                'speed': 'N/A',
+                'manufacturer': 'System RAM',
+                'part_number': 'Generic',
+                'form_factor': 'DIMM'
+            }]
+        info['ram'] = {'modules': modules, 'slots_used': len(modules)}
+    except Exception as e:
+        logging.error("RAM Error: %s", e)
+    try:
+        drives = _linux_physical_drives()
+        if drives:
+            info['drives'] = drives
+    except Exception as e:
+        logging.error("Error collecting physical drives: %s", e)
+
+    has_data = (
+        info.get('motherboard') or
+        (info.get('cpu') and info['cpu'].get('name') != "Unknown CPU") or
+        info.get('drives')
+    )
+    _linux_hardware_info = info if has_data else None
+    _linux_hardware_collected = True
+    return _linux_hardware_info
 
 def get_detailed_hardware_info():
     """
     Collects static hardware info using WMIC (subprocess) to avoid WMI module issues in frozen builds.
+    On Linux the sysfs/DMI backend is used instead.
     """
+    if IS_LINUX:
+        return get_linux_hardware_info()
+
     info = {
         'motherboard': {},
         'cpu': {},
@@ -794,6 +2964,7 @@ def get_event_logs(last_check_time):
     """
     if not WIN32_AVAILABLE:
         return []
+    import win32evtlog
 
     events = []
     target_ids = {41, 1001, 7, 55, 1000, 1002}
@@ -839,7 +3010,7 @@ def get_event_logs(last_check_time):
 
 
 
-@sio.event
+@socket_event
 def exec_command(data):
     """
     Handle remote command execution from server.
@@ -858,16 +3029,22 @@ def exec_command(data):
         try:
             # Use shell=True for flexibility (PowerShell/Bash capability)
             # Timeout set to 30s to prevent hanging processes
-            result = subprocess.run(
+            proc = subprocess.Popen(
                 command, 
                 shell=True, 
                 stdout=subprocess.PIPE, 
                 stderr=subprocess.PIPE, 
-                text=True, 
-                timeout=30
+                text=True
             )
-            output = result.stdout + result.stderr
-            status = 'completed' if result.returncode == 0 else 'failed'
+            restore_child_priority(proc.pid)  # Not the governor's lowered priority
+            try:
+                stdout, stderr = proc.communicate(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.communicate()
+                raise
+            output = stdout + stderr
+            status = 'completed' if proc.returncode == 0 else 'failed'
             if not output.strip():
                 output = "[No Output]"
                 
@@ -888,17 +3065,73 @@ def exec_command(data):
     # Run in strict thread to not block heartbeat
     threading.Thread(target=run_cmd, daemon=True).start()
 
+@socket_event
+def hires_request(data):
+    """
+    Return a window of the sample history to the server (as the event ack); each
+    sample carries the cadence it was taken at ("intervals").
+    Expected data: { 'start': epoch, 'end': epoch } or { 'seconds': 300 }, optional 'max_points'.
+    """
+    data = data or {}
+    start = data.get('start')
+    end = data.get('end')
+    if start is None and data.get('seconds'):
+        start = time.time() - float(data['seconds'])
+    logging.info("Serving high-resolution window (start=%s, end=%s)", start, end)
+    return hires_buffer.window(start, end, data.get('max_points'))
+
+@socket_event
+def live_start(data):
+    """A dashboard viewer opened this machine: stream at LIVE_INTERVAL for the lease duration."""
+    global _live_until
+    lease = (data or {}).get('lease_seconds', 60)
+    lease = min(max(float(lease), LIVE_INTERVAL), LIVE_MAX_LEASE)
+    was_live = is_live()
+    _live_until = time.monotonic() + lease
+    if not was_live:
+        logging.info("Live mode started (lease %.0fs)", lease)
+        _cadence_changed.set()
+
+@socket_event
+def live_stop(data=None):
+    """Last viewer left: fall back to the background cadence."""
+    global _live_until
+    if is_live():
+        logging.info("Live mode stopped")
+    _live_until = 0.0
+
+@socket_event
+def alert_rules(data):
+    """Server pushed its threshold alert policies; evaluate them locally from now on."""
+    count = edge_alerts.load((data or {}).get('rules', []))
+    logging.info("Loaded %d edge alert rule(s)", count)
+    sio.emit('alert_rules_loaded', {'count': count})
+
+@socket_event
+def update_available(data):
+    """Server announced a release: check for it at a per-machine moment inside the rollout window."""
+    global _update_check_due
+    version = (data or {}).get('version')
+    if not version or version == VERSION:
+        return
+    window = max(0.0, float((data or {}).get('rollout_seconds', 0)))
+    # Stable per machine and release, so a reconnect does not reshuffle the slot
+    slot = int(hashlib.sha256(f"{MACHINE_ID}:{version}".encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    _update_check_due = time.time() + slot * window
+    logging.info("Update v%s announced; checking in %.0fs", version, slot * window)
+
 # Socket.IO Event Handlers for connection status
-@sio.event
+@socket_event
 def connect():
     """Called when successfully connected to Socket.IO server."""
+    server_health.socket_state(True)
     logging.info("=" * 60)
     logging.info("\u2713 Socket.IO: CONNECTED")
     logging.info(f"  Machine ID: {MACHINE_ID}")
     logging.info(f"  Server: {config.get('api_url', 'Unknown').replace('/api', '')}")
     logging.info("=" * 60)
 
-@sio.event
+@socket_event
 def connect_error(data):
     """Called when connection attempt fails."""
     logging.error("=" * 60)
@@ -911,29 +3144,43 @@ def connect_error(data):
     logging.error("    - Is firewall blocking connection?")
     logging.error("=" * 60)
 
-@sio.event
+@socket_event
 def disconnect():
     """Called when disconnected from Socket.IO server."""
+    server_health.socket_state(False)
+    socket_manager.wake()
+    _requeue_unacked_alert_events(force=True)  # Their acks can no longer arrive
     logging.warning("=" * 60)
     logging.warning("\u26a0 Socket.IO: DISCONNECTED")
     logging.warning(f"  Machine ID: {MACHINE_ID}")
-    logging.warning("  Will attempt to reconnect on next cycle...")
+    logging.warning("  Reconnecting in the background...")
     logging.warning("=" * 60)
 
 def check_for_updates():
-    """Check if a new agent version is available."""
+    """Check if a new agent version is available (conditional GET: unchanged answers are a 304)."""
+    global _update_etag, _update_cached
+    import requests
     try:
         api_url = config.get("api_url", DEFAULT_API_URL)
         check_url = f"{api_url}/agent/check-update"
+        headers = {"If-None-Match": _update_etag} if _update_etag else {}
         
         response = requests.get(
             check_url, 
             params={"current_version": VERSION},
+            headers=headers,
             timeout=10
         )
         
+        if response.status_code == 304:
+            data = _update_cached
+            if data and data.get("updateAvailable"):
+                return data
+            return None
         if response.status_code == 200:
             data = response.json()
+            _update_etag = response.headers.get("ETag")
+            _update_cached = data
             if data.get("updateAvailable"):
                 logging.info(f"Update available: {data.get('version')} (current: {VERSION})")
                 return data
@@ -942,6 +3189,485 @@ def check_for_updates():
         logging.error(f"Failed to check for updates: {e}")
         return None
 
+# --- Resumable update download ---
+UPDATE_DOWNLOAD_DEFAULTS = {
+    "chunk_kb": 256,   # Read size per iteration (hashing and writing happen per chunk)
+    "max_kbps": 0,     # Bandwidth cap in KB/s; 0 = unlimited
+    "attempts": 5,     # Connection attempts; each resumes where the last one stopped
+}
+
+def _download_settings():
+    settings = dict(UPDATE_DOWNLOAD_DEFAULTS)
+    overrides = config.get("update_download")
+    if isinstance(overrides, dict):
+        settings.update({k: v for k, v in overrides.items() if k in UPDATE_DOWNLOAD_DEFAULTS})
+    return settings
+
+def _hash_existing(path, hasher, block_size):
+    """Feed an existing partial file into the hasher (only needed when resuming after a restart)."""
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            hasher.update(block)
+
+def download_file_resumable(url, dest, expected_size=None, expected_hash=None, attempts=None):
+    """
+    Download url to dest via dest + ".part", resuming with HTTP Range (If-Range on the
+    ETag) after a dropped connection, and hashing SHA-256 as bytes arrive. A small
+    sidecar (.part.json) lets a restarted agent resume too. Returns the hex digest, or
+    raises on failure. dest only appears once size and hash have been verified.
+    """
+    import requests
+    settings = _download_settings()
+    chunk_size = max(8, int(settings["chunk_kb"])) * 1024
+    max_bps = float(settings["max_kbps"]) * 1024
+    part_file = dest + ".part"
+    meta_file = part_file + ".json"
+
+    meta = {}
+    if os.path.exists(part_file) and os.path.exists(meta_file):
+        try:
+            with open(meta_file, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+    if meta.get("url") != url or meta.get("hash") != expected_hash:
+        meta = {"url": url, "hash": expected_hash, "etag": None}
+        for stale in (part_file, meta_file):
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    hasher = hashlib.sha256()
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    if offset:
+        _hash_existing(part_file, hasher, chunk_size)
+        logging.info("Resuming update download at %d bytes", offset)
+
+    attempts = max(1, int(attempts or settings["attempts"]))
+    for attempt in range(attempts):
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if meta.get("etag"):
+                headers["If-Range"] = meta["etag"]
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=(10, 60)) as response:
+                if response.status_code == 416 and expected_size and offset >= expected_size:
+                    break  # Already complete
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    # Server ignored the range (or the file changed): start over
+                    logging.warning("Server did not resume the download; restarting from 0")
+                    offset = 0
+                    hasher = hashlib.sha256()
+                meta["etag"] = response.headers.get("ETag") or meta.get("etag")
+                with open(meta_file, "w") as f:
+                    json.dump(meta, f)
+
+                started = time.monotonic()
+                received = 0
+                with open(part_file, "r+b" if offset else "wb") as f:
+                    f.seek(offset)
+                    f.truncate()
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if not chunk:
+                            continue
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        offset += len(chunk)
+                        received += len(chunk)
+                        if max_bps:
+                            ahead = received / max_bps - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+            if not expected_size or offset >= expected_size:
+                break
+            logging.warning("Update download ended early at %d/%s bytes", offset, expected_size)
+        except (requests.exceptions.RequestException, OSError) as e:
+            logging.warning("Update download interrupted at %d bytes (attempt %d/%d): %s", offset, attempt + 1, attempts, e)
+        if attempt < attempts - 1:
+            time.sleep(send_pacing.backoff(attempt))
+
+    if expected_size and offset != expected_size:
+        raise IOError(f"File size mismatch! Expected {expected_size} bytes, got {offset} bytes")
+    digest = hasher.hexdigest()
+    if expected_hash and digest != expected_hash:
+        for stale in (part_file, meta_file):
+            if os.path.exists(stale):
+                os.remove(stale)
+        raise IOError(f"Hash mismatch! Expected {expected_hash[:16]}..., got {digest[:16]}...")
+
+    os.replace(part_file, dest)
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+    return digest
+
+# --- LAN peer cache for updates ---
+# Agents keep verified update files (named by SHA-256) in a small cache and answer
+# multicast "want" queries for them, so one machine per subnet pulls an update over
+# the WAN and its neighbours copy it over HTTP. Every peer download still goes
+# through download_file_resumable's size/hash check; a bad peer just costs a retry.
+# Off by default: it opens an (unauthenticated, read-only) HTTP port on the LAN.
+PEER_CACHE_DEFAULTS = {
+    "enabled": False,
+    "interface": "",            # IPv4 address to serve/discover on; default: the one routing to the server
+    "group": "239.255.77.77",   # Multicast group (TTL 1: never leaves the subnet)
+    "port": 47700,              # UDP discovery port
+    "http_port": 0,             # Port serving cached files; 0 = ephemeral (advertised in replies)
+    "cache_dir": "",            # Defaults to update_cache next to the log directory
+    "max_entries": 4,           # Cached files kept (oldest evicted)
+    "discover_timeout": 1.5,    # Seconds to collect replies to a query
+    "wait_for_fetch": 180,      # Seconds per update spent waiting on a peer that is already downloading
+}
+PEER_CACHE_PROTOCOL = 1
+
+class PeerCache:
+    """Multicast discovery plus a tiny HTTP server for sharing update files on the LAN."""
+    def __init__(self):
+        self.settings = dict(PEER_CACHE_DEFAULTS)
+        self.instance = "%s-%d-%08x" % (MACHINE_ID, os.getpid(), random.getrandbits(32))
+        self.http_port = None
+        self.address = None
+        self._fetching = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self.served = 0
+
+    def configure(self, overrides=None):
+        self.settings = dict(PEER_CACHE_DEFAULTS)
+        if isinstance(overrides, dict):
+            self.settings.update({k: v for k, v in overrides.items() if k in PEER_CACHE_DEFAULTS})
+
+    @property
+    def cache_dir(self):
+        return self.settings["cache_dir"] or os.path.join(
+            os.path.dirname(LOG_DIR or os.path.abspath(sys.argv[0])), "update_cache")
+
+    def _cached_path(self, sha):
+        if not sha or len(sha) != 64 or any(c not in "0123456789abcdef" for c in sha):
+            return None
+        return os.path.join(self.cache_dir, sha)
+
+    def has(self, sha):
+        path = self._cached_path(sha)
+        return bool(path) and os.path.isfile(path)
+
+    def _lan_address(self):
+        """The configured interface address, or the local address that routes to the server."""
+        if self.settings["interface"]:
+            return self.settings["interface"]
+        host = config.get("api_url", DEFAULT_API_URL).split("://", 1)[-1].split("/", 1)[0].rsplit(":", 1)[0]
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            probe.connect((host, 80))  # No packet is sent; this only picks the route
+            return probe.getsockname()[0]
+        finally:
+            probe.close()
+
+    def start(self):
+        if self._started or not self.settings["enabled"]:
+            return
+        try:
+            self.address = self._lan_address()
+            self._start_http()
+            listener = self._open_listener()
+        except OSError as e:
+            logging.warning("Peer cache disabled: %s", e)
+            return
+        self._started = True
+        threading.Thread(target=self._listen, args=(listener,), daemon=True, name="PeerCache").start()
+        logging.info("Peer cache serving %s on %s:%d", self.cache_dir, self.address, self.http_port)
+
+    # --- serving side ---
+    def _start_http(self):
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        cache = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                sha = self.path.rsplit("/", 1)[-1]
+                path = cache._cached_path(sha) if self.path.startswith("/cache/") else None
+                if not path or not os.path.isfile(path):
+                    self.send_error(404)
+                    return
+                size = os.path.getsize(path)
+                start = 0
+                rng = self.headers.get("Range", "")
+                if rng.startswith("bytes=") and self.headers.get("If-Range", sha) == sha:
+                    try:
+                        start = int(rng[6:].split("-", 1)[0])
+                    except ValueError:
+                        start = 0
+                if start >= size and size:
+                    self.send_error(416)
+                    return
+                self.send_response(206 if start else 200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size - start))
+                self.send_header("ETag", sha)
+                if start:
+                    self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+                self.end_headers()
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    for block in iter(lambda: f.read(256 * 1024), b""):
+                        self.wfile.write(block)
+                cache.served += 1
+
+            def log_message(self, fmt, *args):
+                logging.debug("Peer cache: %s - %s", self.client_address[0], fmt % args)
+
+        server = ThreadingHTTPServer((self.address, int(self.settings["http_port"])), Handler)
+        server.daemon_threads = True
+        self.http_port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True, name="PeerCacheHTTP").start()
+
+    def _open_listener(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Several agents on one host (tests, terminal servers) share the port
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        # Binding to the group address filters out unicast traffic (not supported on Windows)
+        sock.bind(("" if sys.platform == "win32" else self.settings["group"], int(self.settings["port"])))
+        membership = socket.inet_aton(self.settings["group"]) + socket.inet_aton(self.address)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        return sock
+
+    def _listen(self, sock):
+        while True:
+            try:
+                data, addr = sock.recvfrom(2048)
+                msg = json.loads(data)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(msg, dict) or msg.get("op") != "want" or msg.get("from") == self.instance:
+                continue
+            sha = msg.get("sha")
+            if self.has(sha):
+                op = "have"
+            elif sha in self._fetching:
+                op = "fetching"
+            else:
+                continue
+            reply = {"v": PEER_CACHE_PROTOCOL, "op": op, "sha": sha, "port": self.http_port, "from": self.instance}
+            try:
+                sock.sendto(json.dumps(reply).encode(), addr)
+            except OSError:
+                pass
+
+    # --- fetching side ---
+    def discover(self, sha):
+        """Ask the subnet for sha. Returns ([(host, port), ...] in reply order, someone_fetching)."""
+        peers, fetching = [], False
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.address))
+            query = {"v": PEER_CACHE_PROTOCOL, "op": "want", "sha": sha, "from": self.instance}
+            sock.sendto(json.dumps(query).encode(), (self.settings["group"], int(self.settings["port"])))
+            deadline = time.monotonic() + float(self.settings["discover_timeout"])
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    data, addr = sock.recvfrom(2048)
+                    msg = json.loads(data)
+                except socket.timeout:
+                    break
+                except (OSError, ValueError):
+                    continue
+                if not isinstance(msg, dict) or msg.get("sha") != sha or msg.get("from") == self.instance:
+                    continue
+                if msg.get("op") == "have" and isinstance(msg.get("port"), int):
+                    peer = (addr[0], msg["port"])
+                    if peer not in peers:
+                        peers.append(peer)
+                elif msg.get("op") == "fetching":
+                    fetching = True
+        except OSError as e:
+            logging.debug("Peer discovery failed: %s", e)
+        finally:
+            sock.close()
+        return peers, fetching
+
+    def wait_deadline(self):
+        """Deadline for waiting on fetching peers, shared by every fetch of one update."""
+        return time.monotonic() + float(self.settings["wait_for_fetch"])
+
+    def fetch(self, url, dest, expected_size=None, expected_hash=None, wait_until=None):
+        """
+        Same contract as download_file_resumable, but tries the local cache and LAN
+        peers first. If a peer is already downloading the file, wait for it (until
+        wait_until) rather than pulling a second copy over the WAN.
+        """
+        if not self._started or not self._cached_path(expected_hash):
+            return download_file_resumable(url, dest, expected_size, expected_hash)
+
+        cached = self._cached_path(expected_hash)
+        if os.path.isfile(cached):
+            hasher = hashlib.sha256()
+            _hash_existing(cached, hasher, 256 * 1024)
+            if hasher.hexdigest() == expected_hash:
+                import shutil
+                shutil.copyfile(cached, dest)
+                return expected_hash
+            os.remove(cached)
+
+        deadline = wait_until if wait_until is not None else self.wait_deadline()
+        while True:
+            peers, fetching = self.discover(expected_hash)
+            for host, port in peers:
+                peer_url = f"http://{host}:{port}/cache/{expected_hash}"
+                try:
+                    digest = download_file_resumable(peer_url, dest, expected_size, expected_hash, attempts=2)
+                except IOError as e:
+                    logging.warning("Peer %s:%d failed (%s); trying the next source", host, port, e)
+                    continue
+                logging.info("Fetched %s from LAN peer %s:%d", os.path.basename(dest), host, port)
+                self.store(dest, digest)
+                return digest
+            if not fetching or time.monotonic() + 5 >= deadline:
+                break
+            logging.info("A LAN peer is already downloading this update; waiting for it")
+            time.sleep(5)
+
+        with self._lock:
+            self._fetching.add(expected_hash)
+        try:
+            digest = download_file_resumable(url, dest, expected_size, expected_hash)
+        finally:
+            with self._lock:
+                self._fetching.discard(expected_hash)
+        self.store(dest, digest)
+        return digest
+
+    def store(self, path, sha):
+        """Add a verified file to the cache and evict the oldest entries."""
+        target = self._cached_path(sha)
+        if not self.settings["enabled"] or not target or os.path.exists(target):
+            return
+        import shutil
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            shutil.copyfile(path, target + ".tmp")
+            os.replace(target + ".tmp", target)
+            entries = sorted((os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir)
+                              if self._cached_path(n)), key=os.path.getmtime)
+            for old in entries[:-int(self.settings["max_entries"])]:
+                os.remove(old)
+        except OSError as e:
+            logging.warning("Could not add %s to the peer cache: %s", sha[:16], e)
+
+peer_cache = PeerCache()
+
+# --- Delta updates ---
+# Patches are built by the server (server/deltaPatch.js) against recent releases:
+# a zlib-deflated "STDP" header carrying source/target sizes and SHA-256 digests,
+# followed by COPY (from the running executable) and INSERT (new bytes) ops.
+PATCH_MAGIC = b"STDP"
+PATCH_FORMAT_VERSION = 1
+PATCH_OP_COPY = 0x43
+PATCH_OP_INSERT = 0x49
+PATCH_OP_END = 0x45
+
+def apply_delta_patch(source_path, patch_path, dest):
+    """
+    Rebuild a new executable from source_path and a delta patch, writing it to dest.
+    Both the source and the rebuilt file are checked against the digests in the
+    patch header. Returns the target hex digest; raises ValueError on any mismatch.
+    """
+    with open(patch_path, "rb") as f:
+        try:
+            data = zlib.decompress(f.read())
+        except zlib.error as e:
+            raise ValueError(f"Corrupt patch: {e}")
+    if data[:4] != PATCH_MAGIC or data[4] != PATCH_FORMAT_VERSION:
+        raise ValueError("Unsupported patch format")
+    source_size = int.from_bytes(data[5:13], "little")
+    source_hash = data[13:45]
+    target_size = int.from_bytes(data[45:53], "little")
+    target_hash = data[53:85]
+
+    with open(source_path, "rb") as f:
+        source = f.read()
+    if len(source) != source_size or hashlib.sha256(source).digest() != source_hash:
+        raise ValueError("Patch does not apply to this executable")
+
+    hasher = hashlib.sha256()
+    written = 0
+    pos = 85
+    with open(dest, "wb") as out:
+        while True:
+            if pos >= len(data):
+                raise ValueError("Truncated patch")
+            op = data[pos]
+            if op == PATCH_OP_END:
+                break
+            if op == PATCH_OP_COPY:
+                offset = int.from_bytes(data[pos + 1:pos + 9], "little")
+                length = int.from_bytes(data[pos + 9:pos + 13], "little")
+                pos += 13
+                if offset + length > source_size:
+                    raise ValueError("Patch copy out of range")
+                chunk = source[offset:offset + length]
+            elif op == PATCH_OP_INSERT:
+                length = int.from_bytes(data[pos + 1:pos + 5], "little")
+                chunk = data[pos + 5:pos + 5 + length]
+                pos += 5 + length
+                if len(chunk) != length:
+                    raise ValueError("Truncated patch")
+            else:
+                raise ValueError(f"Unknown patch op 0x{op:02x}")
+            out.write(chunk)
+            hasher.update(chunk)
+            written += length
+
+    if written != target_size or hasher.digest() != target_hash:
+        os.remove(dest)
+        raise ValueError("Patched executable failed verification")
+    return hasher.hexdigest()
+
+def try_delta_update(update_info, server_url, update_file, wait_until=None):
+    """Fetch and apply the advertised patch. Returns True if update_file now holds the new version."""
+    patch = update_info.get("patch")
+    expected_hash = update_info.get("fileHash")
+    if not patch or not expected_hash or not getattr(sys, "frozen", False):
+        return False
+    if patch.get("fromVersion") != VERSION:
+        return False
+
+    patch_file = update_file + ".stdp"
+    try:
+        logging.info("Downloading delta patch (%s bytes instead of %s)", patch.get("size"), update_info.get("fileSize"))
+        peer_cache.fetch(f"{server_url}{patch['url']}", patch_file, patch.get("size"), patch.get("hash"), wait_until)
+        digest = apply_delta_patch(sys.executable, patch_file, update_file)
+    except (IOError, ValueError, KeyError) as e:
+        logging.warning("Delta update failed, falling back to full download: %s", e)
+        return False
+    finally:
+        if os.path.exists(patch_file):
+            os.remove(patch_file)
+    if digest != expected_hash:
+        logging.warning("Patched executable does not match the release hash; falling back to full download")
+        os.remove(update_file)
+        return False
+    return True
+
+_update_thread = None
+
+def start_update(update_info):
+    """Download and apply an update on a background thread so telemetry keeps flowing."""
+    global _update_thread
+    if _update_thread and _update_thread.is_alive():
+        logging.info("Update download already in progress")
+        return False
+    _update_thread = threading.Thread(target=download_and_apply_update, args=(update_info,),
+                                      daemon=True, name="updater")
+    _update_thread.start()
+    return True
+
 def download_and_apply_update(update_info):
     """Download new agent version and initiate self-update process with safety checks."""
     # Define paths early for exception handler
@@ -974,40 +3700,22 @@ def download_and_apply_update(update_info):
         backup_file = os.path.join(install_dir, "SysTracker_Agent_Backup.exe")
         current_file = os.path.join(install_dir, EXE_NAME)
         
-        # Download the new executable
-        logging.info("Downloading new agent executable...")
-        response = requests.get(full_download_url, stream=True, timeout=300)
-        response.raise_for_status()
-        
-        # Download to temporary file
-        with open(update_file, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        logging.info(f"Downloaded update to {update_file}")
-        
-        # SAFETY CHECK 1: Verify file size
-        actual_size = os.path.getsize(update_file)
-        if expected_size and actual_size != expected_size:
-            logging.error(f"File size mismatch! Expected {expected_size} bytes, got {actual_size} bytes")
-            os.remove(update_file)
-            return False
-        
-        # SAFETY CHECK 2: Verify SHA256 hash for integrity
-        if expected_hash:
-            logging.info("Verifying file integrity (SHA256)...")
-            sha256_hash = hashlib.sha256()
-            with open(update_file, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            actual_hash = sha256_hash.hexdigest()
-            
-            if actual_hash != expected_hash:
-                logging.error(f"Hash mismatch! Expected {expected_hash[:16]}..., got {actual_hash[:16]}...")
+        # Prefer a delta patch against the running executable; otherwise download the
+        # new executable in full (resumable; size and SHA-256 are verified during transfer)
+        wait_until = peer_cache.wait_deadline()  # One peer-wait budget for patch and full download
+        if try_delta_update(update_info, server_url, update_file, wait_until):
+            logging.info("Rebuilt update from delta patch at %s", update_file)
+            peer_cache.store(update_file, expected_hash)
+        else:
+            logging.info("Downloading new agent executable...")
+            try:
+                peer_cache.fetch(full_download_url, update_file, expected_size, expected_hash, wait_until)
+            except IOError as e:
+                logging.error(str(e))
                 logging.error("Downloaded file may be corrupted or tampered with. Update aborted for safety.")
-                os.remove(update_file)
                 return False
-            
+            logging.info("Downloaded update to %s", update_file)
+        if expected_hash:
             logging.info("File integrity verified successfully!")
         
         # Create updater batch script with backup and rollback capability
@@ -1109,6 +3817,7 @@ del "%~f0"
         
         # Commit suicide - exit immediately to release file lock
         logging.info("Agent exiting for update...")
+        stop_log_listener()
         os._exit(0)  # Force immediate exit without cleanup
         
     except Exception as e:
@@ -1122,6 +3831,403 @@ del "%~f0"
                 logging.error(f"Failed to cleanup update file: {cleanup_error}")
         return False
 
+# --- Memory budget watchdog ---
+MEMORY_BUDGET_DEFAULTS = {
+    "budget_mb": 150,           # Shed caches above this RSS
+    "restart_factor": 1.5,      # Restart when RSS stays above budget * factor after shedding
+    "restart_after_checks": 3,  # Consecutive checks over the restart limit before restarting
+    "snapshot_growth_mb": 20,   # RSS growth that triggers a tracemalloc snapshot/diff
+    "check_interval": 60,       # Seconds between checks
+    "trend_samples": 60,        # RSS samples used for the MB/hour trend
+}
+AGENT_STATE_FILE = "agent_state.json"
+MEMORY_EVENT_LIMIT = 20  # Undelivered memory events kept for the next upload
+
+def _read_own_rss():
+    """Own resident set size in bytes (/proc/self/statm on Linux, psutil elsewhere)."""
+    if IS_LINUX:
+        try:
+            with open('/proc/self/statm', 'rb') as f:
+                return int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, ValueError, IndexError):
+            pass
+    return psutil.Process().memory_info().rss
+
+def shed_memory():
+    """Drop caches and buffers that are rebuilt on demand; returns what was shed."""
+    global _proc_names
+    shed = []
+    if _proc_names:
+        shed.append(f"process names ({len(_proc_names)})")
+        _proc_names = {}  # Swap, don't clear: the processes collector may be iterating the old dict
+    pmap = getattr(psutil, "_pmap", None)  # process_iter() Process cache (psutil path)
+    if pmap:
+        shed.append(f"psutil process cache ({len(pmap)})")
+        pmap.clear()
+    trimmed = log_shipper.trim_buffer(100)
+    if trimmed:
+        shed.append(f"log shipping buffer ({trimmed})")
+    gc.collect()
+    if IS_LINUX:
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)  # Hand freed arenas back to the OS (glibc)
+        except (OSError, AttributeError):
+            pass
+    return shed
+
+class MemoryWatchdog:
+    """
+    Tracks the agent's own RSS against a budget. Growth past snapshot_growth_mb
+    (measured from the RSS after warm-up) starts tracemalloc, reports the top
+    growth sites on the next crossing and stops tracing again; over budget it sheds caches; persistently far over budget it restarts the
+    agent with its state preserved. Events are logged and sent with telemetry.
+    """
+    def __init__(self):
+        self.settings = dict(MEMORY_BUDGET_DEFAULTS)
+        self._samples = collections.deque(maxlen=self.settings["trend_samples"])
+        self._events = collections.deque(maxlen=MEMORY_EVENT_LIMIT)
+        self._last_check = 0.0
+        self._snapshot_rss = None
+        self._snapshot = None
+        self._warm = False
+        self._over_limit_checks = 0
+        self.rss = 0
+
+    def configure(self, overrides=None):
+        self.settings = dict(MEMORY_BUDGET_DEFAULTS)
+        if isinstance(overrides, dict):
+            self.settings.update({k: v for k, v in overrides.items() if k in MEMORY_BUDGET_DEFAULTS})
+        self._samples = collections.deque(self._samples, maxlen=int(self.settings["trend_samples"]))
+
+    def trend_mb_per_hour(self):
+        """Least-squares slope of the recent RSS samples."""
+        if len(self._samples) < 3:
+            return 0.0
+        n = len(self._samples)
+        mean_t = sum(t for t, _ in self._samples) / n
+        mean_r = sum(r for _, r in self._samples) / n
+        var = sum((t - mean_t) ** 2 for t, _ in self._samples)
+        if var == 0:
+            return 0.0
+        slope = sum((t - mean_t) * (r - mean_r) for t, r in self._samples) / var  # bytes/s
+        return slope * 3600 / (1024 * 1024)
+
+    def _event(self, kind, message, **details):
+        logging.warning("Memory watchdog: %s", message)
+        self._events.append(dict(details, type=kind, message=message, rss_mb=round(self.rss / (1024 * 1024), 1),
+                                 timestamp=datetime.datetime.now(datetime.timezone.utc).isoformat()))
+
+    def _growth_snapshot(self):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            self._snapshot = tracemalloc.take_snapshot()
+            self._event("tracing_started", f"RSS grew {self.settings['snapshot_growth_mb']} MB; tracemalloc started")
+            return
+        current = tracemalloc.take_snapshot()
+        top = []
+        for stat in current.compare_to(self._snapshot, "lineno")[:10]:
+            frame = stat.traceback[0]
+            top.append({"site": f"{os.path.basename(frame.filename)}:{frame.lineno}", "size_diff": stat.size_diff, "count_diff": stat.count_diff})
+        self._snapshot = None
+        sites = ", ".join(f"{t['site']} {t['size_diff'] / 1024:+.0f} KiB" for t in top[:3])
+        self._event("growth", f"RSS growth sites: {sites}", top=top)
+        # Tracing costs memory and CPU on every allocation; only run it between two crossings
+        del current
+        tracemalloc.stop()
+
+    def mark_warm(self):
+        """Call once imports and the first collection cycle are done; growth is measured from the next check."""
+        if not self._warm:
+            self._warm = True
+            self._snapshot_rss = None
+
+    def check(self, now=None):
+        """Run at most once per check_interval; may shed caches or restart the agent."""
+        now = time.monotonic() if now is None else now
+        if now - self._last_check < self.settings["check_interval"]:
+            return
+        self._last_check = now
+        self.rss = _read_own_rss()
+        self._samples.append((now, self.rss))
+        mb = 1024 * 1024
+
+        if not self._warm:
+            pass  # Lazy imports and first-cycle caches aren't growth
+        elif self._snapshot_rss is None:
+            self._snapshot_rss = self.rss
+        elif self.rss - self._snapshot_rss >= self.settings["snapshot_growth_mb"] * mb:
+            self._snapshot_rss = self.rss
+            self._growth_snapshot()
+
+        budget = self.settings["budget_mb"] * mb
+        if self.rss <= budget:
+            self._over_limit_checks = 0
+            return
+
+        shed = shed_memory()
+        before = self.rss
+        self.rss = _read_own_rss()
+        self._event("shed", f"RSS {before / mb:.0f} MB over budget {budget / mb:.0f} MB; shed {', '.join(shed) or 'nothing'}",
+                    freed_mb=round((before - self.rss) / mb, 1))
+
+        if self.rss > budget * self.settings["restart_factor"]:
+            self._over_limit_checks += 1
+            if self._over_limit_checks >= self.settings["restart_after_checks"]:
+                self._event("restart", f"RSS {self.rss / mb:.0f} MB still over {self.settings['restart_factor']}x budget; restarting")
+                restart_agent("memory")
+        else:
+            self._over_limit_checks = 0
+
+    def status(self):
+        """Telemetry block: current RSS, budget, trend and events since the last upload."""
+        events = list(self._events)
+        self._events.clear()
+        status = {
+            "rss_mb": round(self.rss / (1024 * 1024), 1),
+            "budget_mb": self.settings["budget_mb"],
+            "trend_mb_per_hour": round(self.trend_mb_per_hour(), 2),
+        }
+        if events:
+            status["events"] = events
+        return status
+
+    def restore_events(self, events):
+        self._events.extend(events or [])
+
+memory_watchdog = MemoryWatchdog()
+
+def _agent_state_path():
+    return os.path.join(LOG_DIR or os.path.dirname(os.path.abspath(sys.argv[0])), AGENT_STATE_FILE)
+
+def save_agent_state(reason):
+    """Persist what a restart would otherwise lose (alert state, queued events, timers)."""
+    state = {
+        "reason": reason,
+        "saved_at": time.time(),
+        "last_update_check": last_update_check,
+        "pending_alert_events": list(_pending_alert_events) + [e for e, _ in _unacked_alert_events.values()],
+        "edge_alerts": edge_alerts.export_state(),
+        "memory_events": list(memory_watchdog._events),
+        "log_records": log_shipper.export_buffer(),
+    }
+    with open(_agent_state_path(), "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+def restore_agent_state():
+    """Load and remove a state file written by save_agent_state; returns the reason or None."""
+    global last_update_check
+    path = _agent_state_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        os.remove(path)
+    except (OSError, ValueError) as e:
+        logging.error("Could not restore agent state: %s", e)
+        return None
+    last_update_check = state.get("last_update_check", last_update_check)
+    _pending_alert_events.extend(state.get("pending_alert_events", []))
+    edge_alerts.import_state(state.get("edge_alerts") or {})
+    memory_watchdog.restore_events(state.get("memory_events"))
+    log_shipper.import_buffer(state.get("log_records"))
+    logging.info("Restored agent state saved before restart (reason: %s)", state.get("reason"))
+    return state.get("reason")
+
+def restart_agent(reason):
+    """Save state, start a fresh agent process and exit this one."""
+    try:
+        save_agent_state(reason)
+    except OSError as e:
+        logging.error("Could not save agent state before restart: %s", e)
+    args = [sys.executable] + (sys.argv[1:] if getattr(sys, 'frozen', False) else sys.argv)
+    env = dict(os.environ, SYSTRACKER_RESTARTED_FROM=str(os.getpid()))
+    if platform.system() == 'Windows':
+        DETACHED_PROCESS = 0x00000008
+        CREATE_NEW_PROCESS_GROUP = 0x00000200
+        subprocess.Popen(args, env=env, creationflags=DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP, close_fds=True)
+    else:
+        subprocess.Popen(args, env=env, close_fds=True, start_new_session=True)
+    logging.info("Agent restarting (%s)...", reason)
+    stop_log_listener()
+    os._exit(0)
+
+# --- Deferred startup tasks ---
+def _collect_hardware_inventory(sys_info):
+    """Background: full hardware inventory; the main loop picks it up once set."""
+    start = time.perf_counter()
+    hw_info = get_detailed_hardware_info()
+    if hw_info:
+        sys_info["hardware_info"] = hw_info
+    STARTUP_TIMINGS["hardware_inventory_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logging.info("Hardware inventory collected in %.0f ms", STARTUP_TIMINGS["hardware_inventory_ms"])
+
+def report_startup_timings():
+    """Log import/startup timings once the first upload has gone out."""
+    timings = ", ".join(f"{k}={v}" for k, v in STARTUP_TIMINGS.items())
+    if STARTUP_TIMINGS.get("first_upload_ms", 0) > STARTUP_BUDGET_MS:
+        logging.warning("Startup over budget (%d ms): %s", STARTUP_BUDGET_MS, timings)
+    else:
+        logging.info("Startup timings: %s", timings)
+
+# --- Field diagnostics (--profile) ---
+# Collector functions timed individually in the wall-clock pass. They are looked
+# up as module globals by get_system_metrics, so wrapping them here is enough.
+PROFILE_COLLECTORS = (
+    "_read_core_counters",
+    "get_top_processes_linux",
+    "get_top_processes_psutil",
+    "get_disk_details",
+    "get_network_interfaces",
+)
+PROFILE_TOP_N = 25
+PROFILE_CYCLE_PAUSE = 0.5  # Seconds between cycles so counters and deltas advance (not measured)
+
+def _profile_cycle(stub, send, timings):
+    """One collection/encode/send cycle, shaped like the main loop."""
+    import requests
+    start = time.perf_counter()
+    metrics = get_system_metrics()
+    window = window_aggregator.snapshot()
+    if window:
+        metrics["window"] = window
+    timings["collect"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    message = OutboundMessage("telemetry", {"machine": stub, "metrics": metrics}, use_binary_encoding())
+    timings["encode"] += time.perf_counter() - start
+
+    if send:
+        start = time.perf_counter()
+        try:
+            requests.post(f"{config['api_url']}/telemetry", data=message.body, headers=message.headers(), timeout=10)
+        except requests.exceptions.RequestException as e:
+            timings["send_errors"] += 1
+            logging.warning("Profile send failed: %s", e)
+        timings["send"] += time.perf_counter() - start
+    return metrics, message
+
+def run_profile(cycles=20, output_dir=None):
+    """
+    Run collection/send cycles under cProfile and tracemalloc and write a report:
+    per-collector wall-clock breakdown, top functions by cumulative time and the
+    top allocation sites per cycle. Payloads are only sent when config.json points
+    at a real server. Returns the report path.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+    import dis
+    import io
+
+    send = config.get("api_url") != DEFAULT_API_URL
+    stub = StaticPart({
+        "id": MACHINE_ID,
+        "hostname": socket.gethostname(),
+        "os_info": f"{platform.system()} {platform.release()}",
+        "version": VERSION,
+    })
+    _prime_cpu()
+    collector_runner.inline = True  # cProfile only sees the calling thread
+    get_system_metrics()  # Warm-up: /proc handles, process-name cache
+
+    # Pass 1: wall clock only, no profiler overhead
+    timings = collections.defaultdict(float)
+    originals = {name: globals()[name] for name in PROFILE_COLLECTORS}
+
+    def timed(name, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[name] += time.perf_counter() - start
+        return wrapper
+
+    globals().update({name: timed(name, fn) for name, fn in originals.items()})
+    try:
+        for _ in range(cycles):
+            _profile_cycle(stub, send, timings)
+            time.sleep(PROFILE_CYCLE_PAUSE)
+    finally:
+        globals().update(originals)
+
+    # Pass 2: cProfile + tracemalloc. Each cycle is bracketed by snapshots taken while
+    # its payload is still referenced, so the diff shows what one cycle allocates.
+    profiler = cProfile.Profile()
+    pass2 = collections.defaultdict(float)
+    trace_filter = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    # Exclude this function's own bookkeeping (snapshots, the per_cycle table)
+    own_code = run_profile.__code__
+    own_last = max(line for _, line in dis.findlinestarts(own_code) if line)
+    trace_filter += [tracemalloc.Filter(False, own_code.co_filename, lineno) for lineno in range(own_code.co_firstlineno, own_last + 1)]
+    per_cycle = collections.defaultdict(lambda: [0, 0])  # (file, line) -> [bytes, blocks]
+    peak = 0
+    per_cycle_peak = hasattr(tracemalloc, "reset_peak")  # Python 3.9+; on 3.8 the peak spans the whole pass
+    tracemalloc.start(1)
+    first = tracemalloc.take_snapshot().filter_traces(trace_filter)
+    for _ in range(cycles):
+        before = tracemalloc.take_snapshot().filter_traces(trace_filter)
+        if per_cycle_peak:
+            tracemalloc.reset_peak()
+        profiler.enable()
+        cycle_result = _profile_cycle(stub, send, pass2)
+        profiler.disable()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        after = tracemalloc.take_snapshot().filter_traces(trace_filter)
+        for stat in after.compare_to(before, "lineno"):
+            if stat.size_diff > 0:
+                frame = stat.traceback[0]
+                entry = per_cycle[(frame.filename, frame.lineno)]
+                entry[0] += stat.size_diff
+                entry[1] += stat.count_diff
+        del cycle_result, before, after
+        time.sleep(PROFILE_CYCLE_PAUSE)
+    growth = tracemalloc.take_snapshot().filter_traces(trace_filter).compare_to(first, "lineno")
+    tracemalloc.stop()
+
+    out = io.StringIO()
+    out.write(f"SysTracker Agent profile - v{VERSION} on {MACHINE_ID} ({platform.platform()})\n")
+    out.write(f"Generated {datetime.datetime.now().isoformat(timespec='seconds')}, {cycles} cycles, "
+              f"send={'yes' if send else 'no (no server configured)'}, encoding={'msgpack' if use_binary_encoding() else JSON_BACKEND}\n\n")
+
+    out.write("Per-collector wall clock (pass 1, no profiler)\n")
+    out.write(f"  {'stage':<28}{'ms/cycle':>10}{'share':>8}\n")
+    cycle_total = sum(timings[k] for k in ("collect", "encode", "send")) or 1e-9
+    rows = [(name, timings[name]) for name in PROFILE_COLLECTORS if name in timings]
+    rows.append(("other (get_system_metrics)", timings["collect"] - sum(t for _, t in rows)))
+    rows += [("encode", timings["encode"]), ("send", timings["send"])]
+    for name, total in rows:
+        out.write(f"  {name:<28}{total / cycles * 1000:>10.2f}{total / cycle_total * 100:>7.1f}%\n")
+    out.write(f"  {'total':<28}{cycle_total / cycles * 1000:>10.2f}\n")
+    if timings["send_errors"]:
+        out.write(f"  send errors: {int(timings['send_errors'])}\n")
+
+    out.write(f"\nTop {PROFILE_TOP_N} functions by cumulative time (pass 2, cProfile)\n")
+    stats_stream = io.StringIO()
+    pstats.Stats(profiler, stream=stats_stream).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    out.write(stats_stream.getvalue())
+
+    out.write(f"Top {PROFILE_TOP_N} allocation sites per cycle (pass 2, tracemalloc; live at end of cycle)\n")
+    out.write(f"  peak traced memory {'during a cycle' if per_cycle_peak else 'during the pass'}: {peak / 1024:.1f} KiB\n")
+    ranked = sorted(per_cycle.items(), key=lambda item: item[1][0], reverse=True)
+    for (filename, lineno), (size, count) in ranked[:PROFILE_TOP_N]:
+        out.write(f"  {size / cycles:>10.0f} B/cycle {count / cycles:>8.1f} blocks/cycle  {filename}:{lineno}\n")
+
+    out.write(f"\nNet memory growth over {cycles} cycles (possible leaks)\n")
+    for stat in growth[:10]:
+        frame = stat.traceback[0]
+        out.write(f"  {stat.size_diff:>+10d} B {stat.count_diff:>+6d} blocks  {frame.filename}:{frame.lineno}\n")
+
+    target_dir = output_dir or LOG_DIR or os.getcwd()
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = os.path.join(target_dir, f"agent_profile_{stamp}.txt")
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+    profiler.dump_stats(os.path.join(target_dir, f"agent_profile_{stamp}.prof"))
+    return report_path
+
 def main():
     if not os.environ.get("SYSTRACKER_TEST_MODE") and not is_admin():
         logging.info("Not running as admin. Requesting elevation...")
@@ -1140,10 +4246,20 @@ def main():
     
     manage_pid()
     logging.info(f"Starting SysTracker Agent on {MACHINE_ID}")
+    adaptive_cadence.configure(config.get("adaptive_sampling"))
+    set_log_level(config.get("log_level"))
+    log_shipper.configure(config.get("log_shipping"))
+    log_shipper.start()
+    memory_watchdog.configure(config.get("memory_budget"))
+    resource_governor.configure(config.get("resource_governor"))
+    collector_runner.configure(config.get("collector_deadlines"))
+    restore_agent_state()
 
     # Prime CPU measurement in background so first reads are accurate without blocking
     import threading
     threading.Thread(target=_prime_cpu, daemon=True).start()
+    start_hires_sampler()
+    nic_sampler.start()
     
     last_event_check = datetime.datetime.now() - datetime.timedelta(minutes=5)
     
@@ -1155,82 +4271,114 @@ def main():
         "version": VERSION,
     }
     
-    # Send initial full hardware info
-    hw_info = get_detailed_hardware_info()
-    if hw_info:
-        sys_info["hardware_info"] = hw_info
+    # Full hardware inventory is slow (WMI / DMI); collect it in the background.
+    # The loop attaches it to the first upload after it becomes available.
+    threading.Thread(target=_collect_hardware_inventory, args=(sys_info,), daemon=True).start()
+    socket_manager.start()
+    peer_cache.configure(config.get("peer_cache"))
+    peer_cache.start()
+    first_upload_pending = True
     
     try:
         # Full machine info with hardware — sent on first boot and refreshed every 5min
         HARDWARE_RESEND_INTERVAL = 300  # seconds
         last_hardware_sent = 0  # force send on first loop
+        reported_log_drops = 0
+        # id + hostname for the last_seen upsert; never changes while the agent runs
+        machine_stub = StaticPart({
+            "id": sys_info["id"],
+            "hostname": sys_info["hostname"],
+            "os_info": sys_info["os_info"],
+            "version": sys_info["version"],
+        })
 
         while True:
-            # 0. Ensure Socket Connection
-            if not sio.connected:
-                try:
-                    server_url = config.get("api_url", "").replace("/api", "")
-                    if server_url:
-                        # Construct query params (python-socketio handles query in url)
-                        query_url = f"{server_url}?role=agent&id={MACHINE_ID}"
-                        logging.info(f"Attempting to connect to Socket.IO...")
-                        logging.info(f"  Server URL: {server_url}")
-                        logging.info(f"  Machine ID: {MACHINE_ID}")
-                        sio.connect(query_url, namespaces=['/'], wait_timeout=5)
-                        logging.info(f"✓ Connected to Socket.IO at {server_url}")
-                    else:
-                        logging.error("✗ Cannot connect to Socket.IO: Server URL not configured")
-                except Exception as e:
-                    logging.error(f"✗ Socket.IO connection failed: {e}")
-                    logging.error(f"  Server URL attempted: {server_url}")
-                    logging.error("  Will retry on next cycle...")
-
-            # 1. Check for agent updates (every 60 minutes)
-            global last_update_check
             now_ts = time.time()
-            if (now_ts - last_update_check) >= UPDATE_CHECK_INTERVAL:
-                try:
-                    logging.info("Checking for agent updates...")
-                    last_update_check = now_ts
-                    update_info = check_for_updates()
-                    if update_info:
-                        # Download and apply update (this will exit the process)
-                        download_and_apply_update(update_info)
-                except Exception as update_error:
-                    logging.error(f"Update check/apply failed: {update_error}")
-                    # Continue normal operation even if update fails
+            memory_watchdog.check()  # May shed caches or, as a last resort, restart the agent
 
-            # 2. Collect Telemetry
-            metrics = get_system_metrics()
+            # 1. Collect Telemetry (skipped while the server has asked us to back off;
+            #    the next upload's window then covers the whole pause)
+            metrics = get_system_metrics() if not send_pacing.paused() else None
             if metrics:
+                memory_watchdog.mark_warm()
                 send_hw = (now_ts - last_hardware_sent) >= HARDWARE_RESEND_INTERVAL
 
-                # Lightweight machine stub sent every cycle (just id + hostname for last_seen upsert)
-                machine_payload = {
-                    "id": sys_info["id"],
-                    "hostname": sys_info["hostname"],
-                    "os_info": sys_info["os_info"],
-                    "version": sys_info["version"],
-                }
+                # Lightweight machine stub sent every cycle (pre-encoded once, spliced into each body)
+                machine_payload = machine_stub
 
                 # Only attach hardware_info when it's time to refresh AND if we have data
                 if send_hw and sys_info.get("hardware_info"):
-                    machine_payload["hardware_info"] = sys_info.get("hardware_info")
+                    machine_payload = dict(machine_stub.value, hardware_info=sys_info.get("hardware_info"))
                     last_hardware_sent = now_ts
 
+                # Per-window statistics of the samples since the previous upload
+                window = window_aggregator.snapshot()
+                if window:
+                    metrics["window"] = window
+                # Live windows are 1s long: counting them would walk the cadence and the
+                # governor ladder in seconds, so both hold their level until the lease ends
+                live = is_live()
+                if not live:
+                    adaptive_cadence.update(window)
+                resource_governor.update(hold=live)
+                metrics["governor"] = resource_governor.status()
+                metrics["link"] = server_health.status()
+                metrics["interval_seconds"] = current_upload_interval()
+                metrics["cadence_mode"] = "live" if is_live() else adaptive_cadence.mode
+                metrics["agent_memory"] = memory_watchdog.status()
+                metrics["collectors"] = collector_runner.status()
+
                 payload = {
                     "machine": machine_payload,
                     "metrics": metrics
                 }
+                alert_events = drain_pending_alert_events()
+                if alert_events:
+                    payload["alert_events"] = alert_events
                 if (datetime.datetime.now() - last_event_check).total_seconds() >= EVENT_POLL_INTERVAL:
-                    events = get_event_logs(last_event_check)
+                    since = last_event_check
+                    events = collector_runner.run("events", lambda: get_event_logs(since), reuse_last=False)
                     if events:
                         payload["events"] = events
-                    last_event_check = datetime.datetime.now()
+                    if events is not None:  # On overrun, the next poll covers the same range again
+                        last_event_check = datetime.datetime.now()
                 
+                if first_upload_pending:
+                    STARTUP_TIMINGS["first_payload_ms"] = round((time.perf_counter() - _PROCESS_START) * 1000, 1)
+                    metrics["startup"] = dict(STARTUP_TIMINGS)
+
                 send_payload("telemetry", payload)
+
+                if first_upload_pending:
+                    first_upload_pending = False
+                    STARTUP_TIMINGS["first_upload_ms"] = round((time.perf_counter() - _PROCESS_START) * 1000, 1)
+                    report_startup_timings()
+
+            dropped = dropped_log_records()
+            if dropped > reported_log_drops:
+                logging.warning("%d log record(s) dropped (log queue full)", dropped - reported_log_drops)
+                reported_log_drops = dropped
+
+            # 2. Check for agent updates: when the server pushed one (at this machine's
+            #    rollout slot), otherwise the hourly conditional poll as a fallback
+            global last_update_check, _update_check_due
+            pushed = bool(_update_check_due) and now_ts >= _update_check_due
+            if pushed or (now_ts - last_update_check) >= UPDATE_CHECK_INTERVAL:
+                try:
+                    logging.info("Checking for agent updates...")
+                    last_update_check = now_ts
+                    _update_check_due = 0.0
+                    update_info = check_for_updates()
+                    if update_info:
+                        # Download and apply in the background (exits the process once staged)
+                        start_update(update_info)
+                except Exception as update_error:
+                    logging.error("Update check/apply failed: %s", update_error)
+                    # Continue normal operation even if update fails
             
-            time.sleep(TELEMETRY_INTERVAL)
+            # Interruptible, jittered wait so a live_start takes effect immediately
+            _cadence_changed.wait(send_pacing.next_wait(current_upload_interval()))
+            _cadence_changed.clear()
             
     except KeyboardInterrupt:
         logging.info("Stopping agent...")
@@ -1276,7 +4424,14 @@ def manage_pid():
         try:
             with open(pid_file, "r") as f:
                 old_pid = int(f.read().strip())
-            if psutil.pid_exists(old_pid):
+            restarted_from = os.environ.get("SYSTRACKER_RESTARTED_FROM")
+            if restarted_from and old_pid == int(restarted_from):
+                # Self-restart (memory watchdog): give the previous process a moment to exit
+                for _ in range(20):
+                    if not psutil.pid_exists(old_pid):
+                        break
+                    time.sleep(0.5)
+            elif psutil.pid_exists(old_pid):
                 logging.error(f"Agent already running (PID: {old_pid}). Exiting.")
                 sys.exit(1)
             else:
@@ -1288,12 +4443,38 @@ def manage_pid():
         f.write(str(pid))
 
 
+STARTUP_TIMINGS["module_ms"] = round((time.perf_counter() - _PROCESS_START) * 1000, 1)
+
 if __name__ == "__main__":
     import sys
     import os
     import ctypes
     import shutil
-    
+
+    # Diagnostics (no elevation required)
+    if "--benchmark" in sys.argv:
+        try:
+            cycles = int(sys.argv[sys.argv.index("--benchmark") + 1])
+        except (IndexError, ValueError):
+            cycles = 200
+        run_collector_benchmark(cycles)
+        run_encoding_benchmark(cycles)
+        sys.exit(0)
+    if "--profile" in sys.argv:
+        try:
+            cycles = int(sys.argv[sys.argv.index("--profile") + 1])
+        except (IndexError, ValueError):
+            cycles = 20
+        setup_logging()
+        load_config()
+        print(f"Profiling {cycles} cycles...")
+        print(f"Report written to {run_profile(cycles)}")
+        sys.exit(0)
+
+    _logging_start = time.perf_counter()
+    setup_logging()
+    STARTUP_TIMINGS["logging_ms"] = round((time.perf_counter() - _logging_start) * 1000, 1)
+
     # Global Admin Check
     if not os.environ.get("SYSTRACKER_TEST_MODE") and not is_admin():
         # Re-run the script/exe with admin privileges
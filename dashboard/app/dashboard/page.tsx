@@ -1,15 +1,15 @@
 'use client';
 
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { useRouter } from 'next/navigation';
-import { io } from 'socket.io-client';
+import { io, Socket } from 'socket.io-client';
 import MachineCard from '../../components/MachineCard';
 import MachineDetails from '../../components/MachineDetails';
 import SystemLoadChart from '../../components/SystemLoadChart';
 import { Machine } from '../../types';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Activity, Search, Cpu, Wifi, Server, Lock, X, Network, HardDrive } from 'lucide-react';
-import { fetchWithAuth, clearToken, isViewer } from '../../lib/auth';
+import { fetchWithAuth, clearToken, isViewer, getToken } from '../../lib/auth';
 
 const container = {
   hidden: { opacity: 0 },
@@ -26,6 +26,9 @@ const item = {
   show: { opacity: 1, y: 0 }
 };
 
+// The server grants agents a 60s live-mode lease per watch; renew well before it expires
+const LIVE_LEASE_RENEW_MS = 30_000;
+
 export default function Dashboard() {
   const [machines, setMachines] = useState<Machine[]>([]);
   const [selectedMachine, setSelectedMachine] = useState<Machine | null>(null);
@@ -35,6 +38,7 @@ export default function Dashboard() {
   const [showAccessDeniedToast, setShowAccessDeniedToast] = useState(false);
 
   const router = useRouter(); // Explicitly use router
+  const socketRef = useRef<Socket | null>(null);
 
   // Handle machine card click with role-based access control
   const handleMachineClick = (machine: Machine) => {
@@ -56,8 +60,11 @@ export default function Dashboard() {
       transports: ['websocket', 'polling'], // Try websocket first, fallback to polling
       reconnectionAttempts: 5,
       reconnectionDelay: 1000,
+      auth: { token: getToken() }, // Required for live mode (watch_machine)
     });
 
+    socketRef.current = socket;
+
     socket.on('connect_error', (err) => {
       console.warn('Socket connection error:', err.message);
     });
@@ -129,10 +136,29 @@ export default function Dashboard() {
     });
 
     return () => {
+      socketRef.current = null;
       socket.disconnect();
     };
   }, [router]);
 
+  // Live mode: while a machine's details are open its agent streams every second
+  const selectedMachineId = selectedMachine?.id;
+  useEffect(() => {
+    const socket = socketRef.current;
+    if (!socket || !selectedMachineId) return;
+
+    const watch = () => socket.emit('watch_machine', { id: selectedMachineId });
+    watch();
+    socket.on('connect', watch);
+    const renew = setInterval(watch, LIVE_LEASE_RENEW_MS);
+
+    return () => {
+      clearInterval(renew);
+      socket.off('connect', watch);
+      socket.emit('unwatch_machine', { id: selectedMachineId });
+    };
+  }, [selectedMachineId]);
+
   // Handle machine delete — removes from state and closes the detail panel
   const handleMachineDelete = (id: string) => {
     setMachines(prev => prev.filter(m => m.id !== id));
@@ -126,7 +126,11 @@ function validateDiskDetails(diskDetails) {
         total_gb: Math.max(0, parseFloat(disk.total_gb) || 0),
         used_gb: Math.max(0, parseFloat(disk.used_gb) || 0),
         free_gb: Math.max(0, parseFloat(disk.free_gb) || 0),
-        percent: Math.max(0, Math.min(100, parseFloat(disk.percent) || 0))
+        percent: Math.max(0, Math.min(100, parseFloat(disk.percent) || 0)),
+        // Agent could not refresh this mount within its deadline: last value and its age
+        stale: disk.stale === true,
+        age_seconds: Math.max(0, parseInt(disk.age_seconds, 10) || 0),
+        slow: disk.slow === true
     })).slice(0, 26);  // Limit to 26 partitions (A-Z on Windows)
 }
 
@@ -0,0 +1,152 @@
+// Agent Delta Patches - SysTracker v3.3
+//
+// Binary patches between agent releases so agents only download what changed.
+// Format (zlib-deflated as a whole):
+//   header: "STDP" | u8 version | u64 source size | 32B source sha256
+//                               | u64 target size | 32B target sha256
+//   ops:    0x43 'C' u64 source offset, u32 length  - copy from the old executable
+//           0x49 'I' u32 length, bytes             - insert new bytes
+//           0x45 'E'                               - end
+// All integers are little-endian. The agent applies the ops to its own
+// executable and verifies both hashes, falling back to the full download.
+//
+// Diffing two 30 MB executables takes seconds of CPU, so the server builds
+// patches with createPatchFile(), which runs this module on a worker thread.
+
+const crypto = require('crypto');
+const fs = require('fs');
+const zlib = require('zlib');
+const { promisify } = require('util');
+const { Worker, isMainThread, parentPort, workerData } = require('worker_threads');
+
+const deflate = promisify(zlib.deflate);
+
+const PATCH_MAGIC = Buffer.from('STDP');
+const PATCH_FORMAT_VERSION = 1;
+const DEFAULT_BLOCK_SIZE = 1024;
+const OP_COPY = 0x43;
+const OP_INSERT = 0x49;
+const OP_END = 0x45;
+
+function sha256(buf) {
+    return crypto.createHash('sha256').update(buf).digest();
+}
+
+/**
+ * rsync-style weak checksum of buf[off, off + len)
+ */
+function weakChecksum(buf, off, len) {
+    let a = 0;
+    let b = 0;
+    for (let i = 0; i < len; i++) {
+        a = (a + buf[off + i]) & 0xffff;
+        b = (b + a) & 0xffff;
+    }
+    return { a, b };
+}
+
+/**
+ * Encode the (uncompressed) ops that turn source into target
+ */
+function encodePatch(source, target, blockSize = DEFAULT_BLOCK_SIZE) {
+    // Index the source by block checksum (first occurrence wins)
+    const index = new Map();
+    for (let off = 0; off + blockSize <= source.length; off += blockSize) {
+        const { a, b } = weakChecksum(source, off, blockSize);
+        const key = ((b << 16) | a) >>> 0;
+        if (!index.has(key)) index.set(key, off);
+    }
+
+    const parts = [];
+    const header = Buffer.alloc(PATCH_MAGIC.length + 1 + 8 + 32 + 8 + 32);
+    let h = PATCH_MAGIC.copy(header, 0);
+    h = header.writeUInt8(PATCH_FORMAT_VERSION, h);
+    h = header.writeBigUInt64LE(BigInt(source.length), h);
+    h += sha256(source).copy(header, h);
+    h = header.writeBigUInt64LE(BigInt(target.length), h);
+    sha256(target).copy(header, h);
+    parts.push(header);
+
+    const emitInsert = (start, end) => {
+        if (end <= start) return;
+        const op = Buffer.alloc(5);
+        op.writeUInt8(OP_INSERT, 0);
+        op.writeUInt32LE(end - start, 1);
+        parts.push(op, target.subarray(start, end));
+    };
+    const emitCopy = (offset, length) => {
+        const op = Buffer.alloc(13);
+        op.writeUInt8(OP_COPY, 0);
+        op.writeBigUInt64LE(BigInt(offset), 1);
+        op.writeUInt32LE(length, 9);
+        parts.push(op);
+    };
+
+    let literalStart = 0;
+    let pos = 0;
+    let sums = target.length >= blockSize ? weakChecksum(target, 0, blockSize) : null;
+    while (sums && pos + blockSize <= target.length) {
+        const srcOff = index.get(((sums.b << 16) | sums.a) >>> 0);
+        if (srcOff !== undefined &&
+            source.compare(target, pos, pos + blockSize, srcOff, srcOff + blockSize) === 0) {
+            // Grow the match both ways before emitting it
+            let len = blockSize;
+            while (pos + len < target.length && srcOff + len < source.length &&
+                   target[pos + len] === source[srcOff + len]) len++;
+            let back = 0;
+            while (pos - back > literalStart && srcOff - back > 0 &&
+                   target[pos - back - 1] === source[srcOff - back - 1]) back++;
+            emitInsert(literalStart, pos - back);
+            emitCopy(srcOff - back, len + back);
+            pos += len;
+            literalStart = pos;
+            if (pos + blockSize <= target.length) sums = weakChecksum(target, pos, blockSize);
+            continue;
+        }
+        if (pos + blockSize >= target.length) break;
+        // Roll the window one byte forward
+        const out = target[pos];
+        const inc = target[pos + blockSize];
+        sums.a = (sums.a - out + inc) & 0xffff;
+        sums.b = (sums.b - blockSize * out + sums.a) & 0xffff;
+        pos++;
+    }
+    emitInsert(literalStart, target.length);
+    parts.push(Buffer.from([OP_END]));
+    return Buffer.concat(parts);
+}
+
+/**
+ * Build a patch that turns source into target (resolves to the deflated patch)
+ */
+function createPatch(source, target, blockSize = DEFAULT_BLOCK_SIZE) {
+    return deflate(encodePatch(source, target, blockSize), { level: 9 });
+}
+
+/**
+ * Build the patch between two files on a worker thread, off the event loop
+ */
+function createPatchFile(sourcePath, targetPath) {
+    return new Promise((resolve, reject) => {
+        const worker = new Worker(__filename, { workerData: { sourcePath, targetPath } });
+        let patch = null;
+        worker.once('message', (msg) => { patch = Buffer.from(msg.buffer, msg.byteOffset, msg.byteLength); });
+        worker.once('error', reject);
+        worker.once('exit', (code) => {
+            if (patch) resolve(patch);
+            else reject(new Error(`patch worker exited with code ${code}`));
+        });
+    });
+}
+
+if (!isMainThread && workerData && workerData.sourcePath) {
+    Promise.all([fs.promises.readFile(workerData.sourcePath), fs.promises.readFile(workerData.targetPath)])
+        .then(([source, target]) => createPatch(source, target))
+        .then((patch) => parentPort.postMessage(patch));  // A rejection surfaces as the worker's 'error'
+}
+
+module.exports = {
+    PATCH_FORMAT_VERSION,
+    createPatch,
+    createPatchFile
+};
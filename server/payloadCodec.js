@@ -0,0 +1,67 @@
+// Agent Payload Decoding - SysTracker v3.3
+//
+// Agents send schema 1 (row-per-object JSON) or, when enabled on the agent and
+// listed in the telemetry response's "encodings", schema 2: MessagePack with the repeated-key tables
+// encoded as { cols: [...], rows: [[...]] }. This shim turns both into the
+// schema 1 shape the telemetry handler expects.
+
+const CONTENT_TYPE_MSGPACK = 'application/msgpack';
+const PAYLOAD_SCHEMA_BINARY = 2;
+const COLUMNAR_TABLES = ['processes', 'disk_details', 'network_interfaces'];
+
+// Optional dependency, not installed by default (npm install @msgpack/msgpack
+// to enable it): without it the server does not advertise MessagePack, and
+// bodies sent anyway are answered with 415 (agents fall back to JSON).
+let msgpackDecode = null;
+try {
+    ({ decode: msgpackDecode } = require('@msgpack/msgpack'));
+} catch (e) {
+    msgpackDecode = null;
+}
+
+// Advertised to agents in every telemetry response
+const ACCEPTED_ENCODINGS = msgpackDecode ? ['json', 'msgpack'] : ['json'];
+
+/**
+ * Expand { cols, rows } tables back into arrays of objects
+ */
+function expandColumnar(payload) {
+    if (!payload || (payload.schema_version || 1) < PAYLOAD_SCHEMA_BINARY) return payload;
+    const metrics = payload.metrics;
+    if (!metrics || typeof metrics !== 'object') return payload;
+
+    for (const key of COLUMNAR_TABLES) {
+        const table = metrics[key];
+        if (table && Array.isArray(table.cols) && Array.isArray(table.rows)) {
+            metrics[key] = table.rows.map(row => {
+                const obj = {};
+                table.cols.forEach((col, i) => { obj[col] = row[i]; });
+                return obj;
+            });
+        }
+    }
+    return payload;
+}
+
+/**
+ * Express middleware: decode application/msgpack bodies (read by express.raw)
+ */
+function decodeAgentPayload(req, res, next) {
+    if (!req.is(CONTENT_TYPE_MSGPACK)) return next();
+    if (!msgpackDecode) {
+        return res.status(415).json({ error: 'MessagePack payloads are not supported by this server' });
+    }
+    try {
+        req.body = expandColumnar(msgpackDecode(req.body));
+        next();
+    } catch (err) {
+        res.status(400).json({ error: 'Invalid MessagePack payload' });
+    }
+}
+
+module.exports = {
+    ACCEPTED_ENCODINGS,
+    CONTENT_TYPE_MSGPACK,
+    expandColumnar,
+    decodeAgentPayload
+};
@@ -30,6 +30,8 @@ CREATE TABLE IF NOT EXISTS metrics (
     machine_id TEXT,
     cpu_usage REAL,
     ram_usage REAL,
+    cpu_max REAL,  -- Peak CPU within the upload window (agent-side aggregation)
+    ram_max REAL,  -- Peak RAM within the upload window (agent-side aggregation)
     disk_total_gb REAL,
     disk_free_gb REAL,
     network_up_kbps REAL,
@@ -47,6 +47,8 @@ const nodemailer = require('nodemailer');
 // Import validation and logging modules using safe require
 const { validateProcessData, validateHardwareInfo, validateDiskDetails } = safeRequire('dataValidation');
 const { logger, LOG_DIR } = safeRequire('errorLogger');
+const { ACCEPTED_ENCODINGS, CONTENT_TYPE_MSGPACK, decodeAgentPayload } = safeRequire('payloadCodec');
+const deltaPatch = safeRequire('deltaPatch');
 
 // Log server startup
 logger.info('SysTracker Server starting...', { pid: process.pid });
@@ -104,6 +106,8 @@ app.use(express.static(dashboardPath, { extensions: ['html'] }));
 app.set('trust proxy', 1); // Trust Nginx proxy headers
 app.use(cors());
 app.use(express.json({ limit: '5mb' })); // Enough for hardware_info payloads
+app.use(express.raw({ type: CONTENT_TYPE_MSGPACK, limit: '5mb' })); // Binary agent payloads (schema 2)
+app.use(decodeAgentPayload);
 
 // Database Setup
 
@@ -158,6 +162,8 @@ function initializeDb() {
                 machine_id TEXT,
                 cpu_usage REAL,
                 ram_usage REAL,
+                cpu_max REAL,
+                ram_max REAL,
                 disk_total_gb REAL,
                 disk_free_gb REAL,
                 network_up_kbps REAL,
@@ -206,6 +212,15 @@ function initializeDb() {
             }
         });
 
+        // Migration: Per-window peaks reported by agents that aggregate 1s samples
+        ['cpu_max', 'ram_max'].forEach(column => {
+            db.run(`ALTER TABLE metrics ADD COLUMN ${column} REAL`, (err) => {
+                if (err && !err.message.includes("duplicate column name")) {
+                    console.error(`Migration error (metrics ${column}):`, err.message);
+                }
+            });
+        });
+
         // Auth: Create admin_users table
         db.run(`CREATE TABLE IF NOT EXISTS admin_users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -444,6 +459,20 @@ function initializeDb() {
             }
         });
 
+        // Agent Patches: binary deltas between releases
+        db.run(`CREATE TABLE IF NOT EXISTS agent_patches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_version TEXT NOT NULL,
+            to_version TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_hash TEXT NOT NULL,
+            file_size INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(from_version, to_version)
+        )`, (err) => {
+            if (err) console.error('Error creating agent_patches table:', err.message);
+        });
+
         // Maintenance Windows Table
         db.run(`CREATE TABLE IF NOT EXISTS maintenance_windows (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -612,9 +641,8 @@ function logAudit(actor, actorId, action, target, detail, ip) {
     );
 }
 
-// Middleware: Authenticate API (Agent)
-const authenticateAPI = async (req, res, next) => {
-    const apiKey = req.headers['x-api-key'];
+// Agent API key: settings override, then .env
+const getAgentApiKey = async () => {
     let validKey = process.env.API_KEY || 'YOUR_STATIC_API_KEY_HERE';
 
     // Check DB for override
@@ -629,6 +657,13 @@ const authenticateAPI = async (req, res, next) => {
     } catch (e) {
         console.error("Error fetching API Key from DB:", e);
     }
+    return validKey;
+};
+
+// Middleware: Authenticate API (Agent)
+const authenticateAPI = async (req, res, next) => {
+    const apiKey = req.headers['x-api-key'];
+    const validKey = await getAgentApiKey();
 
     if (!validKey) {
         // Fallback or warning
@@ -1267,10 +1302,71 @@ app.post('/api/settings/agent/upload', authenticateDashboard, requireAdmin, uplo
             }
             console.log(`[AgentUpdater] New agent release v${version} uploaded by ${req.admin.username} (SHA256: ${hash.substring(0, 16)}...)`);
             res.json({ success: true, message: 'Agent release uploaded successfully', version, hash });
+            buildAgentPatches(version, targetPath, fileSize, () => announceAgentRelease(version));
         }
     );
 });
 
+// Build delta patches from the last few releases to a newly uploaded one.
+// Runs after the upload response, each diff on a worker thread (deltaPatch.js)
+// so the event loop keeps serving; agents without a matching patch keep
+// downloading the full executable.
+const AGENT_PATCH_SOURCES = parseInt(process.env.AGENT_PATCH_SOURCES || '3', 10);
+
+function buildAgentPatches(version, targetPath, targetSize, done) {
+    if (!deltaPatch || AGENT_PATCH_SOURCES <= 0) return done();
+    const patchDir = path.join(BASE_DIR, 'data', 'agent_releases', 'patches');
+    db.all("SELECT version, file_path FROM agent_releases WHERE version != ? ORDER BY upload_date DESC LIMIT ?",
+        [version, AGENT_PATCH_SOURCES], async (err, sources) => {
+            if (err) {
+                console.error('[AgentUpdater] Patch source lookup failed:', err.message);
+                return done();
+            }
+            await fs.promises.mkdir(patchDir, { recursive: true }).catch(() => {});
+            // One worker at a time: each holds both executables in memory
+            for (const src of sources || []) {
+                if (!fs.existsSync(src.file_path)) continue;
+                try {
+                    const started = Date.now();
+                    const patch = await deltaPatch.createPatchFile(src.file_path, targetPath);
+                    if (patch.length >= targetSize / 2) {
+                        console.log(`[AgentUpdater] Skipping patch v${src.version} -> v${version}: too large to help (${patch.length} bytes)`);
+                        continue;
+                    }
+                    const patchPath = path.join(patchDir, `SysTracker_Agent_v${src.version}_to_v${version}.stdp`);
+                    await fs.promises.writeFile(patchPath, patch);
+                    const patchHash = crypto.createHash('sha256').update(patch).digest('hex');
+                    db.run(`INSERT OR REPLACE INTO agent_patches (from_version, to_version, file_path, file_hash, file_size)
+                            VALUES (?, ?, ?, ?, ?)`, [src.version, version, patchPath, patchHash, patch.length]);
+                    console.log(`[AgentUpdater] Patch v${src.version} -> v${version}: ${patch.length} bytes ` +
+                        `(${(100 * patch.length / targetSize).toFixed(1)}% of full, ${Date.now() - started} ms)`);
+                } catch (e) {
+                    console.error(`[AgentUpdater] Failed to build patch v${src.version} -> v${version}:`, e.message);
+                }
+            }
+            done();
+        });
+}
+
+// Push new releases to connected agents instead of waiting for their hourly poll.
+// Each agent picks its own moment inside the rollout window so the fleet does
+// not hit the download endpoint in the same second.
+const AGENT_ROLLOUT_SECONDS = parseInt(process.env.AGENT_ROLLOUT_SECONDS || '1800', 10);
+
+function announceAgentRelease(version, target) {
+    (target || io.to('agents')).emit('update_available', { version, rollout_seconds: AGENT_ROLLOUT_SECONDS });
+    if (!target) console.log(`[AgentUpdater] Announced v${version} to connected agents (rollout over ${AGENT_ROLLOUT_SECONDS}s)`);
+}
+
+// Answer an update check with a strong ETag; an unchanged answer costs a 304
+function sendUpdateInfo(req, res, info) {
+    const etag = `"${crypto.createHash('sha1').update(JSON.stringify(info)).digest('hex')}"`;
+    res.set('ETag', etag);
+    res.set('Cache-Control', 'no-cache');
+    if (req.headers['if-none-match'] === etag) return res.status(304).end();
+    res.json(info);
+}
+
 // Check for agent updates (Public - no auth required, like /api/telemetry)
 app.get('/api/agent/check-update', (req, res) => {
     const { current_version } = req.query;
@@ -1278,18 +1374,32 @@ app.get('/api/agent/check-update', (req, res) => {
     // Get the latest version from database with hash for integrity verification
     db.get("SELECT version, file_hash, file_size FROM agent_releases ORDER BY upload_date DESC LIMIT 1", [], (err, latest) => {
         if (err) return res.status(500).json({ error: err.message });
-        if (!latest) return res.json({ updateAvailable: false });
+        if (!latest) return sendUpdateInfo(req, res, { updateAvailable: false });
 
         // Simple semantic version comparison
         const isNewer = compareVersions(latest.version, current_version || '0.0.0') > 0;
-
-        res.json({
+        const info = {
             updateAvailable: isNewer,
             version: isNewer ? latest.version : null,
             downloadUrl: isNewer ? `/api/agent/download?v=${latest.version}` : null,
             fileHash: isNewer ? latest.file_hash : null,
             fileSize: isNewer ? latest.file_size : null
-        });
+        };
+        if (!isNewer || !current_version) return sendUpdateInfo(req, res, info);
+
+        // Advertise a delta patch when one exists from the agent's version
+        db.get("SELECT file_hash, file_size FROM agent_patches WHERE from_version = ? AND to_version = ?",
+            [current_version, latest.version], (err, patch) => {
+                if (!err && patch) {
+                    info.patch = {
+                        fromVersion: current_version,
+                        url: `/api/agent/patch?from=${encodeURIComponent(current_version)}&to=${latest.version}`,
+                        hash: patch.file_hash,
+                        size: patch.file_size
+                    };
+                }
+                sendUpdateInfo(req, res, info);
+            });
     });
 });
 
@@ -1324,6 +1434,23 @@ app.get('/api/agent/download', (req, res) => {
     }
 });
 
+// Download a delta patch between two agent versions (Public - no auth required)
+app.get('/api/agent/patch', (req, res) => {
+    const { from, to } = req.query;
+    if (!from || !to) return res.status(400).json({ error: 'from and to versions are required' });
+
+    db.get("SELECT file_path FROM agent_patches WHERE from_version = ? AND to_version = ?", [from, to], (err, patch) => {
+        if (err) return res.status(500).json({ error: err.message });
+        if (!patch) return res.status(404).json({ error: 'Patch not found' });
+
+        if (fs.existsSync(patch.file_path)) {
+            res.download(patch.file_path, path.basename(patch.file_path));
+        } else {
+            res.status(404).json({ error: 'Patch file not found on disk' });
+        }
+    });
+});
+
 // Get current distributed version (for dashboard display)
 app.get('/api/settings/agent/version', authenticateDashboard, (req, res) => {
     db.get("SELECT version, upload_date, file_hash, file_size FROM agent_releases ORDER BY upload_date DESC LIMIT 1", [], (err, release) => {
@@ -2121,8 +2248,53 @@ const METRICS_DB_THROTTLE_MS = 10_000; // persist to DB at most once per 10s per
 const lastMachineDbWrite = new Map(); // machineId -> timestamp (ms)
 const MACHINE_DB_THROTTLE_MS = 60_000; // persist machine metadata at most once per minute
 
-app.post('/api/telemetry', authenticateAPI, (req, res) => {
-    const { machine, metrics, events } = req.body;
+// Fleet pacing — every telemetry response carries the minimum upload interval that keeps
+// the whole fleet at or below TELEMETRY_TARGET_RPS; agents stretch their cadence to it.
+// Above TELEMETRY_MAX_RPS in the current second the server sheds load with 503 + a jittered Retry-After.
+const TELEMETRY_TARGET_RPS = parseInt(process.env.TELEMETRY_TARGET_RPS) || 50;
+const TELEMETRY_MAX_RPS = parseInt(process.env.TELEMETRY_MAX_RPS) || TELEMETRY_TARGET_RPS * 4;
+const FLEET_ACTIVE_WINDOW_MS = 5 * 60 * 1000; // agents seen within this window count as active
+const lastTelemetrySeen = new Map(); // machineId -> timestamp (ms)
+let activeAgentCount = 0;
+let activeAgentCountAt = 0;
+let telemetrySecond = 0;
+let telemetryThisSecond = 0;
+
+function fleetPacing(machineId) {
+    const now = Date.now();
+    if (machineId) lastTelemetrySeen.set(machineId, now); // shed requests only read the hint
+    if (now - activeAgentCountAt >= 10_000) {
+        activeAgentCountAt = now;
+        activeAgentCount = 0;
+        for (const [id, seen] of lastTelemetrySeen) {
+            if (now - seen > FLEET_ACTIVE_WINDOW_MS) lastTelemetrySeen.delete(id);
+            else activeAgentCount++;
+        }
+    }
+    return {
+        min_upload_interval: Math.ceil(Math.max(activeAgentCount, 1) / TELEMETRY_TARGET_RPS),
+        active_agents: activeAgentCount
+    };
+}
+
+function telemetryAdmission(req, res, next) {
+    const second = Math.floor(Date.now() / 1000);
+    if (second !== telemetrySecond) {
+        telemetrySecond = second;
+        telemetryThisSecond = 0;
+    }
+    if (++telemetryThisSecond > TELEMETRY_MAX_RPS) {
+        const pacing = fleetPacing();
+        const retryAfter = Math.max(1, Math.ceil(Math.random() * Math.max(pacing.min_upload_interval, 10)));
+        res.set('Retry-After', String(retryAfter));
+        return res.status(503).json({ error: 'Server busy, retry later', pacing });
+    }
+    next();
+}
+
+// Authenticate first: only real agents count toward (and can be shed by) the admission budget
+app.post('/api/telemetry', authenticateAPI, telemetryAdmission, (req, res) => {
+    const { machine, metrics, events, alert_events } = req.body;
 
     if (!machine || !machine.id) {
         logger.warn('Invalid telemetry payload: Machine ID required', { ip: req.ip });
@@ -2146,7 +2318,10 @@ app.post('/api/telemetry', authenticateAPI, (req, res) => {
             network_up_kbps: metrics.network_up_kbps,
             network_down_kbps: metrics.network_down_kbps,
             uptime_seconds: metrics.uptime_seconds,
-            active_vpn: metrics.active_vpn
+            active_vpn: metrics.active_vpn,
+            window: metrics.window,
+            interval_seconds: metrics.interval_seconds,
+            cadence_mode: metrics.cadence_mode
         } : {};
 
         let emittedHardwareInfo = null;
@@ -2177,7 +2352,7 @@ app.post('/api/telemetry', authenticateAPI, (req, res) => {
         });
 
         // Respond to agent immediately so it doesn't wait for DB writes
-        res.json({ success: true });
+        res.json({ success: true, pacing: fleetPacing(machine.id), encodings: ACCEPTED_ENCODINGS });
 
         // --- STEP 2: Persist to DB asynchronously (fire and forget) ---
         // Machine upsert — runs only if throttled or if critical info changed
@@ -2222,10 +2397,14 @@ app.post('/api/telemetry', authenticateAPI, (req, res) => {
 
             const diskDetailsStr = validatedDiskDetails ? JSON.stringify(validatedDiskDetails) : (metrics.disk_details ? JSON.stringify(metrics.disk_details) : null);
             const processesStr = validatedProcesses ? JSON.stringify(validatedProcesses) : (metrics.processes ? JSON.stringify(metrics.processes) : null);
+            // Window peaks from the agent's 1s samples (older agents send point samples only)
+            const window = metrics.window || {};
+            const cpuMax = window.cpu ? window.cpu.max : null;
+            const ramMax = window.ram ? window.ram.max : null;
             db.run(
-                `INSERT INTO metrics (machine_id, cpu_usage, ram_usage, disk_total_gb, disk_free_gb, network_up_kbps, network_down_kbps, active_vpn, disk_details, processes, timestamp)
-             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)`,
-                [machine.id, metrics.cpu_usage, metrics.ram_usage, metrics.disk_total_gb, metrics.disk_free_gb,
+                `INSERT INTO metrics (machine_id, cpu_usage, ram_usage, cpu_max, ram_max, disk_total_gb, disk_free_gb, network_up_kbps, network_down_kbps, active_vpn, disk_details, processes, timestamp)
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)`,
+                [machine.id, metrics.cpu_usage, metrics.ram_usage, cpuMax, ramMax, metrics.disk_total_gb, metrics.disk_free_gb,
                 metrics.network_up_kbps || 0, metrics.network_down_kbps || 0, metrics.active_vpn ? 1 : 0,
                     diskDetailsStr, processesStr],
                 (err) => {
@@ -2247,6 +2426,11 @@ app.post('/api/telemetry', authenticateAPI, (req, res) => {
         );
     }
 
+    // Edge alert transitions the agent could not deliver over Socket.IO
+    if (alert_events && Array.isArray(alert_events)) {
+        alert_events.forEach(event => handleEdgeAlertEvent(machine.id, event));
+    }
+
     // Events insert (always persist — events are sparse and important)
     if (events && Array.isArray(events) && events.length > 0) {
         const stmt = db.prepare(`INSERT INTO events (machine_id, event_id, source, message, severity, timestamp) VALUES (?, ?, ?, ?, ?, ?)`);
@@ -2261,8 +2445,41 @@ app.post('/api/telemetry', authenticateAPI, (req, res) => {
 });
 
 // Ingest Logs (from Agents)
+const LOG_BATCH_MAX = 500; // Records accepted per batch; the rest are dropped
+
 app.post('/api/logs', authenticateAPI, (req, res) => {
-    const { machine_id, level, message, stack_trace } = req.body;
+    const { machine_id, level, message, stack_trace, records } = req.body;
+
+    // Batched form from the agent log shipper: { machine_id, records: [{ level, message, stack_trace, timestamp }] }
+    if (Array.isArray(records)) {
+        if (!machine_id) {
+            return res.status(400).json({ error: 'Invalid payload: machine_id required' });
+        }
+        const batch = records.filter(r => r && r.message).slice(0, LOG_BATCH_MAX);
+        if (batch.length === 0) return res.json({ success: true, accepted: 0 });
+
+        db.serialize(() => {
+            const stmt = db.prepare(`
+                INSERT INTO logs (machine_id, level, message, stack_trace, timestamp)
+                VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP));
+            `);
+            batch.forEach(r => stmt.run([
+                machine_id,
+                String(r.level || 'info').substring(0, 20),
+                String(r.message).substring(0, 4000),
+                r.stack_trace ? String(r.stack_trace).substring(0, 20000) : null,
+                r.timestamp || null
+            ]));
+            stmt.finalize((err) => {
+                if (err) {
+                    console.error("Error inserting log batch:", err);
+                    return res.status(500).json({ error: 'Database error' });
+                }
+                res.json({ success: true, accepted: batch.length });
+            });
+        });
+        return;
+    }
 
     if (!machine_id || !message) {
         return res.status(400).json({ error: 'Invalid payload: machine_id and message required' });
@@ -2643,6 +2860,37 @@ app.get('/api/maintenance/active', (req, res) => {
     });
 });
 
+// Live mode: while a machine has viewers its agent streams at 1s under a lease that
+// the dashboard keeps renewing; without viewers agents stay on their background cadence.
+const LIVE_LEASE_SECONDS = 60;
+const LIVE_MAX_WATCHED = parseInt(process.env.LIVE_MAX_WATCHED || '4', 10); // machines one viewer socket may stream
+// Agent sockets must send auth.api_key; keyless agents (released builds up to v3.3.1) are still let in
+// with a deprecation warning for this release unless AGENT_SOCKET_AUTH_REQUIRED=true
+const AGENT_SOCKET_AUTH_REQUIRED = process.env.AGENT_SOCKET_AUTH_REQUIRED === 'true';
+const legacyAgentSocketsWarned = new Set(); // machine ids already warned about keyless sockets
+const liveViewers = new Map(); // machineId -> Set of dashboard socket ids
+
+// Dashboard sockets carry the login JWT in the handshake (auth.token); checked on
+// every watch so an expired session stops renewing live mode
+const socketViewer = (socket) => {
+    const token = socket.handshake.auth && socket.handshake.auth.token;
+    if (!token) return null;
+    try {
+        return jwt.verify(token, JWT_SECRET);
+    } catch (e) {
+        return null;
+    }
+};
+
+const unwatchMachine = (socketId, machineId) => {
+    const viewers = liveViewers.get(machineId);
+    if (!viewers || !viewers.delete(socketId)) return;
+    if (viewers.size === 0) {
+        liveViewers.delete(machineId);
+        io.to(`agent_${machineId}`).emit('live_stop', {});
+    }
+};
+
 // Socket.io for Real-time Dashboard
 io.on('connection', (socket) => {
     // console.log('Dashboard connected:', socket.id);
@@ -2651,10 +2899,77 @@ io.on('connection', (socket) => {
     const machineId = socket.handshake.query.id;
 
     if (isAgent && machineId) {
-        socket.join(`agent_${machineId}`);
-        // console.log(`[Socket] Agent joined room: agent_${machineId}`);
+        // Agents prove their identity with the same API key as the HTTP endpoints;
+        // nothing is joined or trusted until it checks out
+        getAgentApiKey().then(validKey => {
+            const apiKey = socket.handshake.auth && socket.handshake.auth.api_key;
+            if (!apiKey && !AGENT_SOCKET_AUTH_REQUIRED) {
+                // Released agents up to v3.3.1 do not send a key; accepted for one more release
+                if (!legacyAgentSocketsWarned.has(machineId)) {
+                    legacyAgentSocketsWarned.add(machineId);
+                    console.warn(`[Socket] Agent ${machineId} (v${socket.handshake.query.v || '?'}) connected without an API key; ` +
+                        'this is deprecated and will be rejected in the next release (set AGENT_SOCKET_AUTH_REQUIRED=true to enforce now)');
+                }
+            } else if (!apiKey || apiKey !== validKey) {
+                console.warn(`[Socket] Rejected agent socket for ${machineId}: invalid API key`);
+                return socket.disconnect(true);
+            }
+            if (!socket.connected) return;
+
+            socket.join(`agent_${machineId}`);
+            // console.log(`[Socket] Agent joined room: agent_${machineId}`);
+            // Agent (re)connected while someone is watching it: resume live streaming
+            if (liveViewers.has(machineId)) {
+                socket.emit('live_start', { lease_seconds: LIVE_LEASE_SECONDS });
+            }
+
+            // Edge alerting: agents evaluate threshold policies locally at full sample rate
+            socket.join('agents');
+            pushAlertRules(socket);
+
+            // Agent reconnecting on an old version: tell it about the current release
+            const agentVersion = socket.handshake.query.v;
+            if (agentVersion) {
+                db.get("SELECT version FROM agent_releases ORDER BY upload_date DESC LIMIT 1", [], (err, latest) => {
+                    if (!err && latest && compareVersions(latest.version, agentVersion) > 0) {
+                        announceAgentRelease(latest.version, socket);
+                    }
+                });
+            }
+
+            socket.on('alert_rules_loaded', () => {
+                edgeAlertMachines.set(machineId, socket.id);
+            });
+
+            // Firing/clearing transitions are sent immediately; ack so the agent can drop its copy
+            socket.on('alert_event', (event, ack) => {
+                handleEdgeAlertEvent(machineId, event);
+                if (typeof ack === 'function') ack({ ok: true });
+            });
+        });
     }
 
+    // Live mode: dashboard viewers watching a machine (renewed periodically by the dashboard)
+    const watched = new Set();
+    socket.on('watch_machine', (data) => {
+        if (isAgent || !data || !data.id) return;
+        if (!socketViewer(socket)) return;
+        if (!watched.has(data.id) && watched.size >= LIVE_MAX_WATCHED) {
+            console.warn(`[Live] Socket ${socket.id} tried to watch more than ${LIVE_MAX_WATCHED} machines`);
+            return;
+        }
+        watched.add(data.id);
+        if (!liveViewers.has(data.id)) liveViewers.set(data.id, new Set());
+        liveViewers.get(data.id).add(socket.id);
+        io.to(`agent_${data.id}`).emit('live_start', { lease_seconds: LIVE_LEASE_SECONDS });
+    });
+
+    socket.on('unwatch_machine', (data) => {
+        if (!data || !data.id) return;
+        watched.delete(data.id);
+        unwatchMachine(socket.id, data.id);
+    });
+
     // Listen for Command Results from Agent
     socket.on('command_result', (data) => {
         const { id, output, status } = data; // command id
@@ -2686,7 +3001,15 @@ io.on('connection', (socket) => {
         });
     });
 
-    socket.on('disconnect', () => { });
+    socket.on('disconnect', () => {
+        for (const id of [...liveViewers.keys()]) unwatchMachine(socket.id, id);
+        // Until it reconnects and reloads the rules, the server evaluates this agent's thresholds again
+        // (only if this socket is the one that loaded them: a stale socket's late disconnect
+        // must not clear the state of the agent's newer connection)
+        if (isAgent && machineId && edgeAlertMachines.get(machineId) === socket.id) {
+            edgeAlertMachines.delete(machineId);
+        }
+    });
 });
 
 // --- REMOTE COMMAND EXECUTION ---
@@ -2723,6 +3046,23 @@ app.post('/api/machines/:id/command', authenticateDashboard, (req, res) => {
     stmt.finalize();
 });
 
+// --- HIGH-RESOLUTION HISTORY ---
+// Agents keep ~30 min of 1s samples in memory; fetch a window on demand instead of storing it
+app.get('/api/machines/:id/hires', authenticateDashboard, (req, res) => {
+    const { id } = req.params;
+    const request = {};
+    if (req.query.start) request.start = Number(req.query.start);
+    if (req.query.end) request.end = Number(req.query.end);
+    if (!request.start) request.seconds = Math.min(parseInt(req.query.seconds, 10) || 300, 1800);
+    if (req.query.max_points) request.max_points = parseInt(req.query.max_points, 10);
+
+    io.to(`agent_${id}`).timeout(10000).emit('hires_request', request, (err, responses) => {
+        if (responses && responses.length > 0) return res.json(responses[0]);
+        if (err) return res.status(504).json({ error: 'Agent did not respond in time' });
+        res.status(404).json({ error: 'Agent not connected' });
+    });
+});
+
 app.get('/api/machines/:id/commands', authenticateDashboard, (req, res) => {
     const { id } = req.params;
     db.all('SELECT * FROM commands WHERE machine_id = ? ORDER BY created_at DESC LIMIT 50', [id], (err, rows) => {
@@ -2765,51 +3105,59 @@ app.delete('/api/scripts/:id', authenticateDashboard, (req, res) => {
 });
 
 // --- ALERTING SYSTEM ---
-const evaluateAlerts = (machineId, metrics) => {
-    db.all('SELECT * FROM alert_policies WHERE enabled = 1', (err, policies) => {
-        if (err || !policies) return;
-
-        const handlePolicyDecision = (policy, value, triggered) => {
-            if (triggered) {
-                db.get('SELECT id FROM alerts WHERE machine_id = ? AND policy_id = ? AND status = "active"',
-                    [machineId, policy.id],
-                    (err, existing) => {
-                        if (!existing) {
-                            const alertId = crypto.randomUUID();
-                            console.log(`[Alert] Triggered: ${policy.name} on ${machineId} (Value: ${value})`);
-                            db.run('INSERT INTO alerts (id, machine_id, policy_id, value, status, created_at) VALUES (?, ?, ?, ?, "active", CURRENT_TIMESTAMP)',
-                                [alertId, machineId, policy.id, value]);
-
-                            db.run('INSERT INTO events (machine_id, event_id, source, message, severity, timestamp) VALUES (?, 9999, "Alert System", ?, "Warning", CURRENT_TIMESTAMP)',
-                                [machineId, `Triggered: ${policy.name} (${value} ${policy.operator} ${policy.threshold})`]);
-
-                            db.get('SELECT hostname FROM machines WHERE id = ?', [machineId], (err, machineParams) => {
-                                if (machineParams) {
-                                    db.get('SELECT email FROM admin_users LIMIT 1', (err, admin) => {
-                                        if (admin && admin.email) {
-                                            const alertsList = [{ type: policy.name, message: `Value: ${value} (Threshold: ${policy.threshold})` }];
-                                            const html = emailTemplates.alertEmail(machineParams.hostname, alertsList);
-                                            sendEmail(admin.email, `[Alert] ${policy.name} on ${machineParams.hostname}`,
-                                                `Machine ${machineParams.hostname} triggered ${policy.name}. Value: ${value}`, html);
-                                        }
-                                    });
+// Record a firing/resolved decision for one policy (shared by server-side and agent-side evaluation)
+const applyAlertDecision = (machineId, policy, value, triggered) => {
+    if (triggered) {
+        db.get('SELECT id FROM alerts WHERE machine_id = ? AND policy_id = ? AND status = "active"',
+            [machineId, policy.id],
+            (err, existing) => {
+                if (!existing) {
+                    const alertId = crypto.randomUUID();
+                    console.log(`[Alert] Triggered: ${policy.name} on ${machineId} (Value: ${value})`);
+                    db.run('INSERT INTO alerts (id, machine_id, policy_id, value, status, created_at) VALUES (?, ?, ?, ?, "active", CURRENT_TIMESTAMP)',
+                        [alertId, machineId, policy.id, value]);
+
+                    db.run('INSERT INTO events (machine_id, event_id, source, message, severity, timestamp) VALUES (?, 9999, "Alert System", ?, "Warning", CURRENT_TIMESTAMP)',
+                        [machineId, `Triggered: ${policy.name} (${value} ${policy.operator} ${policy.threshold})`]);
+
+                    db.get('SELECT hostname FROM machines WHERE id = ?', [machineId], (err, machineParams) => {
+                        if (machineParams) {
+                            db.get('SELECT email FROM admin_users LIMIT 1', (err, admin) => {
+                                if (admin && admin.email) {
+                                    const alertsList = [{ type: policy.name, message: `Value: ${value} (Threshold: ${policy.threshold})` }];
+                                    const html = emailTemplates.alertEmail(machineParams.hostname, alertsList);
+                                    sendEmail(admin.email, `[Alert] ${policy.name} on ${machineParams.hostname}`,
+                                        `Machine ${machineParams.hostname} triggered ${policy.name}. Value: ${value}`, html);
                                 }
                             });
                         }
                     });
-            } else {
-                db.run('UPDATE alerts SET status = "resolved", resolved_at = CURRENT_TIMESTAMP WHERE machine_id = ? AND policy_id = ? AND status = "active"',
-                    [machineId, policy.id],
-                    function (err) {
-                        if (this.changes > 0) {
-                            console.log(`[Alert] Resolved: ${policy.name} on ${machineId}`);
-                            db.run('INSERT INTO events (machine_id, event_id, source, message, severity, timestamp) VALUES (?, 9998, "Alert System", ?, "Info", CURRENT_TIMESTAMP)',
-                                [machineId, `Resolved: ${policy.name}`]);
-                        }
-                    }
-                );
+                }
+            });
+    } else {
+        db.run('UPDATE alerts SET status = "resolved", resolved_at = CURRENT_TIMESTAMP WHERE machine_id = ? AND policy_id = ? AND status = "active"',
+            [machineId, policy.id],
+            function (err) {
+                if (this.changes > 0) {
+                    console.log(`[Alert] Resolved: ${policy.name} on ${machineId}`);
+                    db.run('INSERT INTO events (machine_id, event_id, source, message, severity, timestamp) VALUES (?, 9998, "Alert System", ?, "Info", CURRENT_TIMESTAMP)',
+                        [machineId, `Resolved: ${policy.name}`]);
+                }
             }
-        };
+        );
+    }
+};
+
+// Metrics that agents evaluate locally against their 1s samples once they have loaded the rules
+const EDGE_ALERT_METRICS = ['cpu', 'ram', 'disk', 'network'];
+const edgeAlertMachines = new Map(); // machine id -> socket id of the agent connection that confirmed it evaluates EDGE_ALERT_METRICS
+
+const evaluateAlerts = (machineId, metrics) => {
+    db.all('SELECT * FROM alert_policies WHERE enabled = 1', (err, policies) => {
+        if (err || !policies) return;
+
+        const handlePolicyDecision = (policy, value, triggered) => applyAlertDecision(machineId, policy, value, triggered);
+        const evaluatedOnAgent = edgeAlertMachines.has(machineId);
 
         policies.forEach(policy => {
             if (policy.metric === 'crash') {
@@ -2828,6 +3176,9 @@ const evaluateAlerts = (machineId, metrics) => {
                 return;
             }
 
+            // Threshold policies are judged on the agent; it reports firing/clearing via alert_event
+            if (evaluatedOnAgent && EDGE_ALERT_METRICS.includes(policy.metric)) return;
+
             let value = null;
             if (policy.metric === 'cpu') value = metrics.cpu;
             else if (policy.metric === 'ram') value = metrics.ram;
@@ -2856,6 +3207,34 @@ app.delete('/api/scripts/:id', authenticateDashboard, (req, res) => {
     });
 });
 
+// Send the enabled threshold policies to agents (one socket, or every agent when target is omitted)
+const pushAlertRules = (target) => {
+    const placeholders = EDGE_ALERT_METRICS.map(() => '?').join(', ');
+    db.all(`SELECT id, name, metric, operator, threshold, duration_minutes, priority FROM alert_policies WHERE enabled = 1 AND metric IN (${placeholders})`,
+        EDGE_ALERT_METRICS, (err, policies) => {
+            if (err) return console.error('[Alert] Failed to load rules for agents:', err.message);
+            const rules = (policies || []).map(p => ({
+                id: p.id,
+                name: p.name,
+                metric: p.metric,
+                operator: p.operator,
+                threshold: p.threshold,
+                duration_seconds: (p.duration_minutes || 0) * 60,
+                priority: p.priority
+            }));
+            (target || io.to('agents')).emit('alert_rules', { rules });
+        });
+};
+
+// Apply a firing/cleared transition reported by an agent's edge evaluator
+const handleEdgeAlertEvent = (machineId, event) => {
+    if (!machineId || !event || !event.policy_id) return;
+    db.get('SELECT * FROM alert_policies WHERE id = ?', [event.policy_id], (err, policy) => {
+        if (err || !policy) return;
+        applyAlertDecision(machineId, policy, event.value, event.state === 'firing');
+    });
+};
+
 // --- ALERT POLICIES API ---
 app.get('/api/alerts/policies', authenticateDashboard, (req, res) => {
     db.all('SELECT * FROM alert_policies ORDER BY created_at DESC', (err, rows) => {
@@ -2877,6 +3256,7 @@ app.post('/api/alerts/policies', authenticateDashboard, (req, res) => {
         [id, name, metric, operator, threshold, duration_minutes || 1, priority || 'high', enabled ? 1 : 0],
         (err) => {
             if (err) return res.status(500).json({ error: err.message });
+            pushAlertRules();
             res.json({ success: true, id });
         }
     );
@@ -2886,6 +3266,7 @@ app.delete('/api/alerts/policies/:id', authenticateDashboard, (req, res) => {
     const { id } = req.params;
     db.run('DELETE FROM alert_policies WHERE id = ?', [id], function (err) {
         if (err) return res.status(500).json({ error: err.message });
+        pushAlertRules();
         res.json({ success: true, deleted: this.changes });
     });
 });